@@ -1,12 +1,31 @@
 from fastapi import APIRouter
 
+from app.core.config import settings
+
 router = APIRouter()
 
-from app.api.v1.endpoints import users, transactions, auth, statistics, tax, badges #noqa: E402
+from app.api.v1.endpoints import (  # noqa: E402
+    auth,
+    badges,
+    export,
+    media,
+    statistics,
+    tax,
+    transactions,
+    users,
+)
+
+# Async read endpoints take precedence over their sync versions when enabled
+if settings.ASYNC_DB_ENABLED:
+    router.include_router(users.async_router, prefix="/users", tags=["users"])
+    router.include_router(transactions.async_router, prefix="/transactions", tags=["transactions"])
+    router.include_router(statistics.async_router, prefix="/statistics", tags=["statistics"])
 
 router.include_router(auth.router, prefix="/auth", tags=["auth"])
 router.include_router(users.router, prefix="/users", tags=["users"])
 router.include_router(transactions.router, prefix="/transactions", tags=["transactions"])
 router.include_router(statistics.router, prefix="/statistics", tags=["statistics"])
 router.include_router(tax.router, prefix="", tags=["tax"]) # Using prefix="" to match /api/tax
-router.include_router(badges.router, prefix="/badges", tags=["badges"]) 
\ No newline at end of file
+router.include_router(badges.router, prefix="/badges", tags=["badges"])
+router.include_router(export.router, prefix="/export", tags=["export"])
+router.include_router(media.router, prefix="/media", tags=["media"])
@@ -1,15 +1,19 @@
-from typing import Generator
+import time
+from collections.abc import AsyncGenerator, Generator
+from typing import Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from pydantic import ValidationError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
 
+from app.core.auth_cache import AuthSnapshot, cache_auth, get_cached_auth
 from app.core.config import settings
-from app.db.session import SessionLocal
-from app.models.user import User
 from app.core.security import ALGORITHM
+from app.db.session import AsyncSessionLocal, SessionLocal
+from app.models.user import User
 from app.schemas.token import TokenPayload
 
 # Reusable OAuth2 password bearer for token extraction
@@ -27,22 +31,73 @@ def get_db() -> Generator:
     finally:
         db.close()
 
-def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
-) -> User:
+
+async def get_async_db() -> AsyncGenerator:
     """
-    Validate access token and return current user
+    Dependency for getting async DB session, available when ASYNC_DB_ENABLED is set
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def decode_access_token(token: str) -> tuple[dict, TokenPayload]:
+    """
+    Validate access token and return its claims and payload
     """
     try:
-        payload = jwt.decode(
+        claims = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[ALGORITHM]
         )
-        token_data = TokenPayload(**payload)
+        return claims, TokenPayload(**claims)
     except (jwt.JWTError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
+
+
+def get_cached_snapshot(token: str) -> Optional[AuthSnapshot]:
+    """
+    Get the cached user snapshot if this exact token was already verified and has not expired
+    """
+    try:
+        user_id = int(jwt.get_unverified_claims(token)["sub"])
+    except (jwt.JWTError, KeyError, TypeError, ValueError):
+        return None
+
+    entry = get_cached_auth(user_id)
+    if entry is None or entry.token != token or entry.claims.get("exp", 0) <= time.time():
+        return None
+    return entry.snapshot
+
+
+def snapshot_user(snapshot: AuthSnapshot) -> User:
+    """
+    Build a detached User with only the snapshot fields loaded.
+    Once merged into a session, the rest of the row is loaded on first access
+    """
+    user = User(
+        id=snapshot.user_id,
+        is_active=snapshot.is_active,
+        is_staff=snapshot.is_staff,
+        is_superuser=snapshot.is_superuser,
+    )
+    make_transient_to_detached(user)
+    return user
+
+
+def get_current_user(
+    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
+) -> User:
+    """
+    Validate access token and return current user.
+    Permission checks of a recently seen token are served from the auth cache without a query
+    """
+    snapshot = get_cached_snapshot(token)
+    if snapshot is not None:
+        return db.merge(snapshot_user(snapshot), load=False)
+
+    claims, token_data = decode_access_token(token)
     
     user = db.query(User).filter(User.id == token_data.sub).first()
     if not user:
@@ -51,19 +106,59 @@ def get_current_user(
             detail="User not found",
         )
     
+    cache_auth(token, claims, AuthSnapshot.from_user(user))
     return user
 
-def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+
+async def get_current_user_async(
+    db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)
+) -> User:
     """
-    Get current user and verify it's active
+    Validate access token and return current user loaded with the async session.
+    Fields outside the auth snapshot must be accessed inside AsyncSession.run_sync
     """
-    if not current_user.is_active:
+    snapshot = get_cached_snapshot(token)
+    if snapshot is not None:
+        return await db.merge(snapshot_user(snapshot), load=False)
+
+    claims, token_data = decode_access_token(token)
+
+    user = await db.get(User, token_data.sub)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found",
+        )
+
+    cache_auth(token, claims, AuthSnapshot.from_user(user))
+    return user
+
+
+def check_active(user: User) -> User:
+    """
+    Verify the user is active
+    """
+    if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Inactive user",
         )
     
-    return current_user
+    return user
+
+
+def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+    """
+    Get current user and verify it's active
+    """
+    return check_active(current_user)
+
+
+async def get_current_active_user_async(current_user: User = Depends(get_current_user_async)) -> User:
+    """
+    Get current user with the async session and verify it's active
+    """
+    return check_active(current_user)
 
 def get_current_active_superuser(current_user: User = Depends(get_current_active_user)) -> User:
     """
@@ -1,13 +1,14 @@
 from datetime import timedelta
 from typing import Any, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status, Form
+from fastapi import APIRouter, Depends, Form, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
 from app.api.v1.deps import get_db
 from app.core.config import settings
-from app.core.security import create_access_token, verify_password
+from app.core.security import create_access_token, verify_and_update_password
 from app.models.user import User
 from app.schemas.token import Token, TokenPayload
 
@@ -15,14 +16,14 @@ router = APIRouter()
 
 
 @router.post("/jwt/create/", response_model=Token)
-def login_access_token(
+async def login_access_token(
     db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
     # Try to authenticate the user
-    user = authenticate_user(
+    user = await authenticate_user(
         db, username=form_data.username, password=form_data.password
     )
     if not user:
@@ -52,7 +53,8 @@ def refresh_access_token(
     """
     Refresh access token using refresh token
     """
-    from jose import jwt, JWTError
+    from jose import JWTError, jwt
+
     from app.core.security import ALGORITHM
     
     try:
@@ -94,7 +96,8 @@ def verify_token(token: str) -> Any:
     """
     Verify a token's validity
     """
-    from jose import jwt, JWTError
+    from jose import JWTError, jwt
+
     from app.core.security import ALGORITHM
     
     try:
@@ -106,21 +109,30 @@ def verify_token(token: str) -> Any:
         return {"valid": False}
 
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+async def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
     """
-    Authenticate a user by username and password
+    Authenticate a user by username and password.
+    bcrypt runs in the password hashing pool, so the event loop is never blocked
     """
     # Find user by username
-    user = db.query(User).filter(User.username == username).first()
+    user = await run_in_threadpool(
+        lambda: db.query(User).filter(User.username == username).first()
+    )
     if not user:
         return None
     
     # Verify password
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await verify_and_update_password(password, user.hashed_password)
+    if not valid:
         return None
     
     # Check if user is active
     if not user.is_active:
         return None
     
-    return user 
\ No newline at end of file
+    # Rehash passwords stored with outdated bcrypt rounds
+    if new_hash:
+        user.hashed_password = new_hash
+        await run_in_threadpool(db.commit)
+
+    return user
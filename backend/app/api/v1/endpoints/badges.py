@@ -1,17 +1,22 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks
+
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
 from sqlalchemy.orm import Session
 
-from app.api.v1.deps import get_db, get_current_active_user, get_current_active_superuser
+from app.api.v1.deps import (
+    get_current_active_superuser,
+    get_current_active_user,
+    get_db,
+)
+from app.core.media import delete_badge as delete_badge_images
+from app.core.media import upload_badge
 from app.models.badge import Badge
 from app.models.user import User
 from app.schemas.badge import BadgeCreate, BadgeUpdate
-from app.core.media import upload_badge, delete_badge
 
 router = APIRouter()
 
 
-@router.get("/", response_model=List[dict])
+@router.get("/", response_model=list[dict])
 def get_badges(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
@@ -116,7 +121,7 @@ def update_badge(
 
 
 @router.delete("/{badge_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_badge(
+async def delete_badge(
     badge_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_superuser)
@@ -138,13 +143,13 @@ def delete_badge(
     
     # Удаляем файлы изображений
     if badge.image_filename:
-        delete_badge(badge_id)
+        await delete_badge_images(badge_id, badge.image_hash)
     
     db.delete(badge)
     db.commit()
 
 
-@router.get("/all", response_model=List[dict])
+@router.get("/all", response_model=list[dict])
 def get_all_badges_admin(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_superuser)
@@ -227,7 +232,6 @@ def unassign_badge_from_user(
 async def upload_badge_image(
     badge_id: int,
     image: UploadFile = File(...),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_superuser)
 ):
@@ -248,27 +252,25 @@ async def upload_badge_image(
             detail="Файл должен быть изображением"
         )
     
-    # Удаляем старое изображение если есть
-    if badge.image_filename:
-        delete_badge(badge_id)
-    
-    # Загружаем новое изображение
-    filename = await upload_badge(image, badge_id, background_tasks)
+    # Загружаем новое изображение, файлы старого удаляются
+    filename, image_hash = await upload_badge(image, badge_id, badge.image_hash)
     
     # Обновляем запись в базе
     badge.image_filename = filename
+    badge.image_hash = image_hash
     db.commit()
     db.refresh(badge)
     
     return {
         "message": "Изображение плашки загружено",
         "badge_id": badge_id,
-        "filename": filename
+        "filename": filename,
+        "image_urls": badge.image_urls,
     }
 
 
 @router.delete("/{badge_id}/image", response_model=dict)
-def delete_badge_image(
+async def delete_badge_image(
     badge_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_superuser)
@@ -290,10 +292,11 @@ def delete_badge_image(
         )
     
     # Удаляем файлы изображений
-    delete_badge(badge_id)
+    await delete_badge_images(badge_id, badge.image_hash)
     
     # Очищаем поле в базе
     badge.image_filename = None
+    badge.image_hash = None
     db.commit()
     db.refresh(badge)
     
@@ -0,0 +1,186 @@
+import csv
+import io
+import json
+import zlib
+from collections.abc import Iterable, Iterator
+from decimal import Decimal
+from enum import Enum
+from typing import Callable
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Query, Session, joinedload
+
+from app.api.v1.deps import get_current_active_superuser
+from app.db.session import SessionLocal
+from app.models.transaction import Transaction, TransactionRecipient
+from app.models.user import User
+
+router = APIRouter()
+
+# Rows fetched from the server-side cursor at a time
+EXPORT_BATCH_SIZE = 1000
+# Encoded output is flushed to the client in chunks of about this size
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+class ExportFormat(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+
+def iter_export_rows(build_query: Callable[[Session], Query]) -> Iterator[list]:
+    """
+    Stream rows for export from a server-side cursor in batches of EXPORT_BATCH_SIZE.
+    Uses its own session because the response body is sent after request dependencies are closed
+    """
+    db = SessionLocal()
+    try:
+        query = build_query(db).execution_options(stream_results=True).yield_per(EXPORT_BATCH_SIZE)
+        for item in query:
+            yield item.full_info_as_list()
+    finally:
+        db.close()
+
+
+def encode_csv(headers: list[str], rows: Iterable[list]) -> Iterator[str]:
+    """
+    Encode rows as CSV chunks
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _json_default(value):
+    """
+    Encode exact money as a JSON number and anything else as a string
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def encode_ndjson(headers: list[str], rows: Iterable[list]) -> Iterator[str]:
+    """
+    Encode rows as newline-delimited JSON objects
+    """
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(headers, row)), ensure_ascii=False, default=_json_default) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield "".join(lines)
+            lines = []
+            size = 0
+    yield "".join(lines)
+
+
+def gzip_chunks(chunks: Iterable[str]) -> Iterator[bytes]:
+    """
+    Compress text chunks into a gzip stream on the fly
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_response(
+    name: str,
+    headers: list[str],
+    build_query: Callable[[Session], Query],
+    export_format: ExportFormat,
+    compress: bool,
+) -> StreamingResponse:
+    """
+    Build a streaming response with the exported rows
+    """
+    rows = iter_export_rows(build_query)
+    if export_format == ExportFormat.csv:
+        chunks = encode_csv(headers, rows)
+        media_type = "text/csv; charset=utf-8"
+    else:
+        chunks = encode_ndjson(headers, rows)
+        media_type = "application/x-ndjson"
+
+    filename = f"{name}.{export_format.value}"
+    if compress:
+        body = gzip_chunks(chunks)
+        media_type = "application/gzip"
+        filename += ".gz"
+    else:
+        body = (chunk.encode("utf-8") for chunk in chunks)
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/users")
+def export_users(
+    format: ExportFormat = ExportFormat.csv,
+    compress: bool = False,
+    current_user: User = Depends(get_current_active_superuser),
+):
+    """
+    Export all users as CSV or NDJSON. Only accessible to superusers.
+    """
+    return export_response(
+        "users",
+        User.full_info_headers_as_list(),
+        lambda db: db.query(User).order_by(User.id),
+        format,
+        compress,
+    )
+
+
+@router.get("/transactions")
+def export_transactions(
+    format: ExportFormat = ExportFormat.csv,
+    compress: bool = False,
+    current_user: User = Depends(get_current_active_superuser),
+):
+    """
+    Export all transactions as CSV or NDJSON. Only accessible to superusers.
+    """
+    return export_response(
+        "transactions",
+        Transaction.full_info_headers_as_list(),
+        lambda db: db.query(Transaction).options(joinedload(Transaction.creator)).order_by(Transaction.id),
+        format,
+        compress,
+    )
+
+
+@router.get("/recipients")
+def export_recipients(
+    format: ExportFormat = ExportFormat.csv,
+    compress: bool = False,
+    current_user: User = Depends(get_current_active_superuser),
+):
+    """
+    Export all transaction recipients as CSV or NDJSON. Only accessible to superusers.
+    """
+    return export_response(
+        "recipients",
+        TransactionRecipient.full_info_headers_as_list(),
+        lambda db: db.query(TransactionRecipient)
+        .options(joinedload(TransactionRecipient.user))
+        .order_by(TransactionRecipient.id),
+        format,
+        compress,
+    )
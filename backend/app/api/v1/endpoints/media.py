@@ -0,0 +1,69 @@
+from enum import Enum
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import FileResponse
+
+from app.core.media import (
+    AVATAR_ROOT,
+    BADGE_ROOT,
+    output_formats,
+    render_stored_thumbnail,
+    stored_version,
+    variant_filename,
+)
+from app.core.thumbnails import THUMBNAIL_SIZES, thumbnail_cache
+
+router = APIRouter()
+
+
+class MediaFolder(str, Enum):
+    avatars = "avatars"
+    badges = "badges"
+
+
+MEDIA_FOLDER_ROOTS = {
+    MediaFolder.avatars: AVATAR_ROOT,
+    MediaFolder.badges: BADGE_ROOT,
+}
+
+
+@router.get("/{folder}/{name}/{size}.{image_format}")
+async def get_thumbnail(
+    folder: MediaFolder,
+    name: str,
+    size: int,
+    image_format: str,
+    v: Optional[str] = None,
+):
+    """
+    Get a square thumbnail of an avatar or a badge image in any whitelisted size and format.
+    Thumbnails are rendered from the stored original on first request and cached on disk.
+    With v set to the current content hash the response is cached forever.
+    """
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Size must be one of {sorted(THUMBNAIL_SIZES)}",
+        )
+    if image_format not in output_formats():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Format must be one of {output_formats()}",
+        )
+    if name.startswith(".") or "/" in name:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+
+    original = MEDIA_FOLDER_ROOTS[folder] / variant_filename(name, "original", "png")
+    try:
+        version = await stored_version(original)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found") from None
+
+    path = await thumbnail_cache.get(
+        f"{folder.value}-{name}.{version}-{size}.{image_format}",
+        lambda: render_stored_thumbnail(original, size, image_format),
+    )
+
+    cache_control = "public, max-age=31536000, immutable" if v == version else "public, no-cache"
+    return FileResponse(path, media_type=f"image/{image_format}", headers={"Cache-Control": cache_control})
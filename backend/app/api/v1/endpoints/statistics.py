@@ -1,64 +1,123 @@
-from typing import Dict
-from sqlalchemy.orm import Session
-from sqlalchemy.sql import func
-
-from fastapi import APIRouter, Depends, HTTPException, status
-
-from app.api.v1.deps import get_current_active_user, get_db
-from app.models.user import User
-
-router = APIRouter()
-
-
-@router.get("/", response_model=Dict[str, float])
-def get_statistics(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user),
-):
-    """
-    Get system statistics like average and total balance.
-    Only staff and superusers can access this endpoint.
-    """
-    # Check if user has permission to view statistics
-    if not current_user.is_staff and not current_user.is_superuser:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not enough permissions to access statistics",
-        )
-    
-    # Get active non-staff users (students)
-    student_query = db.query(User).filter(
-        User.is_active,
-        User.is_staff == False,
-        User.is_superuser == False
-    )
-    
-    # Count students
-    student_count = student_query.count()
-    
-    if student_count == 0:
-        # Return zeros if no students
-        return {
-            "avg_balance": 0.0,
-            "total_balance": 0.0
-        }
-    
-    # Calculate total balance
-    total_balance = db.query(func.sum(User.balance)).filter(
-        User.is_active == True,
-        User.is_staff == False,
-        User.is_superuser == False
-    ).scalar() or 0.0
-    
-    # Calculate average balance
-    avg_balance = total_balance / student_count
-    
-    # Format the results
-    # Round to 2 decimal places
-    total_balance = round(total_balance, 2)
-    avg_balance = round(avg_balance, 2)
-    
-    return {
-        "avg_balance": avg_balance,
-        "total_balance": total_balance
-    } 
\ No newline at end of file
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.api.v1.deps import (
+    get_async_db,
+    get_current_active_superuser,
+    get_current_active_user,
+    get_current_active_user_async,
+    get_db,
+)
+from app.core.statistics import build_snapshot, format_statistics, statistics_cache
+from app.models.statistics_aggregate import StatisticsAggregate
+from app.models.user import User
+from app.schemas.statistics import StatisticsSnapshot
+
+router = APIRouter()
+# Async versions of the read-heavy endpoints, registered when ASYNC_DB_ENABLED is set
+async_router = APIRouter()
+
+
+def check_statistics_access(current_user: User):
+    """
+    Only staff and superusers can access statistics
+    """
+    if not current_user.is_staff and not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions to access statistics",
+        )
+
+
+def get_snapshot(db: Session) -> dict:
+    """
+    Cached statistics snapshot, rebuilt from the running aggregates when their version changes
+    """
+    snapshot = statistics_cache.get(int(db.execute(StatisticsAggregate.version_query()).scalar()))
+    if snapshot is None:
+        aggregates = db.execute(StatisticsAggregate.all_query()).all()
+        snapshot = statistics_cache.put(build_snapshot(aggregates))
+    return snapshot
+
+
+async def get_snapshot_async(db: AsyncSession) -> dict:
+    """
+    Async get_snapshot
+    """
+    snapshot = statistics_cache.get(int((await db.execute(StatisticsAggregate.version_query())).scalar()))
+    if snapshot is None:
+        aggregates = (await db.execute(StatisticsAggregate.all_query())).all()
+        snapshot = statistics_cache.put(build_snapshot(aggregates))
+    return snapshot
+
+
+@router.get("/", response_model=dict[str, float])
+def get_statistics(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Get system statistics like average and total balance.
+    Only staff and superusers can access this endpoint.
+    """
+    check_statistics_access(current_user)
+    return format_statistics(get_snapshot(db))
+
+
+@async_router.get("/", response_model=dict[str, float])
+async def get_statistics_async(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async),
+):
+    """
+    Get system statistics like average and total balance.
+    Only staff and superusers can access this endpoint.
+    """
+    check_statistics_access(current_user)
+    return format_statistics(await get_snapshot_async(db))
+
+
+@router.get("/snapshot", response_model=StatisticsSnapshot)
+def get_statistics_snapshot(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Get the full statistics snapshot: per-party balances, money flow by transaction type,
+    attendance counters and the balance distribution (median, percentiles, histogram).
+    Only staff and superusers can access this endpoint.
+    """
+    check_statistics_access(current_user)
+    return get_snapshot(db)
+
+
+@async_router.get("/snapshot", response_model=StatisticsSnapshot)
+async def get_statistics_snapshot_async(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async),
+):
+    """
+    Get the full statistics snapshot.
+    Only staff and superusers can access this endpoint.
+    """
+    check_statistics_access(current_user)
+    return await get_snapshot_async(db)
+
+
+@router.post("/rebuild", response_model=StatisticsSnapshot)
+def rebuild_statistics(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_superuser),
+):
+    """
+    Recount the running statistics from the users and transactions, for data changed
+    behind the application's back (manual SQL, a restore). Writers wait until it is done.
+    Only superusers can access this endpoint.
+    """
+    StatisticsAggregate.populate(db, force=True)
+    db.commit()
+    logger.info(f"Statistics rebuilt by {current_user.username}")
+    return get_snapshot(db)
@@ -1,11 +1,18 @@
+from typing import Optional
+
+import numpy as np
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
 from loguru import logger
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
 
 from app.api.v1.deps import get_current_active_superuser, get_db
-from app.models.user import User
+from app.core.constants import DAILY_TAX_AMOUNT, States, TransactionTypeEnum
+from app.core.fines import PioneerCounters, equator_study_fines, final_study_fines
+from app.core.scheduler import DAILY_TAX_JOB, scheduler_today
+from app.models.scheduled_run import ScheduledRun
 from app.models.transaction import Transaction, TransactionRecipient
-from app.core.constants import TransactionTypeEnum, States, DAILY_TAX_AMOUNT
+from app.models.user import User
 
 router = APIRouter()
 
@@ -15,41 +22,40 @@ def apply_daily_tax(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_superuser),
 ):
+    """
+    Charge the daily tax to all active pioneers, at most once a day.
+    Recipients are created with one INSERT ... SELECT from users and the transaction
+    is processed with set-based updates, all in a single DB transaction,
+    so the number of queries doesn't depend on the number of pioneers
+    """
     logger.info(f"Applying daily tax: {DAILY_TAX_AMOUNT}@")
     
-    # Get all active non-staff users (pioneers)
-    users = db.query(User).filter(
-        User.is_active == True,
-        User.is_staff == False,
-        User.is_superuser == False
-    ).all()
-    
-    if not users:
-        logger.warning("No active users found to apply tax")
-        return {"message": "No active users found to apply tax"}
+    # Only one daily tax per day, manual or scheduled
+    run_id = ScheduledRun.claim(db, DAILY_TAX_JOB, scheduler_today())
+    if run_id is None:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Daily tax has already been applied today",
+        )
     
-    # Create a new transaction for the daily tax
-    transaction = Transaction.new_transaction(
+    # Create a new transaction with all active non-staff users (pioneers)
+    # as recipients with negative amount (tax)
+    transaction, recipients_count = Transaction.new_pioneer_transaction(
         creator=current_user,
         transaction_type=TransactionTypeEnum.tax,
-        description=f"",
-        db=db
+        bucks=-DAILY_TAX_AMOUNT,
+        description="",
+        db=db,
     )
     
-    # Add all users as recipients with negative amount (tax)
-    recipients_count = 0
-    for user in users:
-        recipient = TransactionRecipient(
-            transaction_id=transaction.id,
-            user_id=user.id,
-            bucks=-DAILY_TAX_AMOUNT,
-            description=f""
-        )
-        db.add(recipient)
-        recipients_count += 1
+    if not recipients_count:
+        db.rollback()
+        logger.warning("No active users found to apply tax")
+        return {"message": "No active users found to apply tax"}
     
-    # Process the transaction to apply the changes
-    db.commit()
+    # Process commits the transaction together with its recipients and the run
+    ScheduledRun.set_transaction(db, run_id, transaction.id)
     transaction.process(db)
     
     logger.info(f"Daily tax applied to {recipients_count} users")
@@ -60,6 +66,50 @@ def apply_daily_tax(
     }
 
 
+def apply_study_fines(
+    db: Session,
+    creator: User,
+    transaction_type: TransactionTypeEnum,
+    description: str,
+    counters: PioneerCounters,
+    fines: np.ndarray,
+) -> Optional[Transaction]:
+    """
+    Fine pioneers with positive fines: all recipients are inserted in one statement and the
+    transaction is created, filled and processed in a single DB transaction.
+    Returns None if nobody has to be fined
+    """
+    fined = fines > 0
+    if not fined.any():
+        return None
+
+    transaction = Transaction.new_transaction(
+        creator=creator,
+        transaction_type=transaction_type,
+        description=description,
+        db=db,
+        commit=False,
+    )
+    db.execute(insert(TransactionRecipient), [
+        {
+            "transaction_id": transaction.id,
+            "user_id": int(user_id),
+            "bucks": -int(fine_amount),
+            "certs": 0,
+            "lab": 0,
+            "lec": 0,
+            "sem": 0,
+            "fac": 0,
+            "description": f"{description} ({int(fine_amount)}@)",
+            "counted": False,
+        }
+        for user_id, fine_amount in zip(counters.user_ids[fined], fines[fined])
+    ])
+    # Process commits the transaction together with its recipients
+    transaction.process(db)
+    return transaction
+
+
 @router.post("/equatorial_fine")
 def apply_equatorial_fine(
     db: Session = Depends(get_db),
@@ -71,59 +121,26 @@ def apply_equatorial_fine(
     """
     logger.info("Calculating equatorial fines")
     
-    # Get all active non-staff users (pioneers)
-    users = db.query(User).filter(
-        User.is_active == True,
-        User.is_staff == False,
-        User.is_superuser == False
-    ).all()
-    
-    if not users:
+    counters = PioneerCounters.load(db)
+    if not len(counters.user_ids):
         logger.warning("No active users found to check for equatorial fines")
         return {"message": "No active users found to check for equatorial fines"}
     
-    # Create a new transaction for the equatorial fine
-    transaction = Transaction.new_transaction(
-        creator=current_user,
-        transaction_type=TransactionTypeEnum.equatorial_fine,
-        description="Экваториальный образовательный штраф",
-        db=db
+    fines = equator_study_fines(counters)
+    transaction = apply_study_fines(
+        db,
+        current_user,
+        TransactionTypeEnum.fine_equatorial,
+        "Экваториальный образовательный штраф",
+        counters,
+        fines,
     )
-    
-    # Calculate and apply fine for each user
-    recipients_count = 0
-    total_fine = 0
-    
-    for user in users:
-        # Calculate the equatorial fine for this user
-        fine_amount = user.get_equator_study_fine(db)
-        
-        # Skip if no fine needed
-        if fine_amount <= 0:
-            continue
-        
-        # Add user as recipient with negative amount (fine)
-        recipient = TransactionRecipient(
-            transaction_id=transaction.id,
-            user_id=user.id,
-            bucks=-fine_amount,
-            description=f"Экваториальный образовательный штраф ({fine_amount}@)"
-        )
-        db.add(recipient)
-        recipients_count += 1
-        total_fine += fine_amount
-    
-    # If no recipients (no fines to apply), delete the transaction
-    if recipients_count == 0:
-        db.delete(transaction)
-        db.commit()
+    if transaction is None:
         logger.info("No equatorial fines needed, no transaction created")
         return {"message": "No equatorial fines needed"}
     
-    # Process the transaction to apply the changes
-    db.commit()
-    transaction.process(db)
-    
+    recipients_count = int((fines > 0).sum())
+    total_fine = int(fines.sum())
     logger.info(f"Equatorial fine applied to {recipients_count} users, total: {total_fine}@")
     
     return {
@@ -143,62 +160,29 @@ def apply_final_fine(
     """
     logger.info("Calculating final fines")
     
-    # Get all active non-staff users (pioneers)
-    users = db.query(User).filter(
-        User.is_active == True,
-        User.is_staff == False,
-        User.is_superuser == False
-    ).all()
-    
-    if not users:
+    counters = PioneerCounters.load(db)
+    if not len(counters.user_ids):
         logger.warning("No active users found to check for final fines")
         return {"message": "No active users found to check for final fines"}
     
-    # Create a new transaction for the final fine
-    transaction = Transaction.new_transaction(
-        creator=current_user,
-        transaction_type=TransactionTypeEnum.final_fine,
-        description="Финальный образовательный штраф",
-        db=db
+    fines = final_study_fines(counters)
+    transaction = apply_study_fines(
+        db,
+        current_user,
+        TransactionTypeEnum.fine_final,
+        "Финальный образовательный штраф",
+        counters,
+        fines,
     )
-    
-    # Calculate and apply fine for each user
-    recipients_count = 0
-    total_fine = 0
-    
-    for user in users:
-        # Calculate the final fine for this user
-        fine_amount = user.get_final_study_fine(db)
-        
-        # Skip if no fine needed
-        if fine_amount <= 0:
-            continue
-        
-        # Add user as recipient with negative amount (fine)
-        recipient = TransactionRecipient(
-            transaction_id=transaction.id,
-            user_id=user.id,
-            bucks=-fine_amount,
-            description=f"Финальный образовательный штраф ({fine_amount}@)"
-        )
-        db.add(recipient)
-        recipients_count += 1
-        total_fine += fine_amount
-    
-    # If no recipients (no fines to apply), delete the transaction
-    if recipients_count == 0:
-        db.delete(transaction)
-        db.commit()
+    if transaction is None:
         logger.info("No final fines needed, no transaction created")
         return {"message": "No final fines needed"}
     
-    # Process the transaction to apply the changes
-    db.commit()
-    transaction.process(db)
-    
+    recipients_count = int((fines > 0).sum())
+    total_fine = int(fines.sum())
     logger.info(f"Final fine applied to {recipients_count} users, total: {total_fine}@")
     
     return {
         "message": f"Final fine applied to {recipients_count} users, total: {total_fine}@",
         "transaction_id": transaction.id
-    } 
\ No newline at end of file
+    }
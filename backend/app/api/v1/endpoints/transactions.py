@@ -1,37 +1,66 @@
-from typing import List
+import base64
+from datetime import datetime
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from loguru import logger
+from sqlalchemy import select, tuple_, union
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
-from app.api.v1.deps import get_current_active_user, get_db
-from app.models.user import User
+from app.api.v1.deps import (
+    get_async_db,
+    get_current_active_user,
+    get_current_active_user_async,
+    get_db,
+)
+from app.core.constants import States, TransactionTypeEnum
+from app.core.idempotency import IDEMPOTENCY_HEADER, run_idempotent
 from app.models.transaction import Transaction, TransactionRecipient
-from app.core.constants import TransactionTypeEnum, States
+from app.models.user import User
 
 router = APIRouter()
+# Async versions of the read-heavy endpoints, registered when ASYNC_DB_ENABLED is set
+async_router = APIRouter()
 
+# Response header with the cursor of the next page of transactions
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Largest page of transactions a client can request
+MAX_PAGE_SIZE = 1000
 
-def format_transaction_for_frontend(transaction: Transaction, db: Session) -> dict:
+
+def format_transactions_for_frontend(transactions: list[Transaction], db: Session) -> list[dict]:
     """
-    Formats a Transaction object to match the frontend expected schema
+    Formats a page of Transaction objects to match the frontend expected schema.
+    Recipients with their usernames are loaded by one joined query and creators by one IN query
     """
-    # Get all recipients for this transaction
-    recipients = db.query(TransactionRecipient).filter(TransactionRecipient.transaction_id == transaction.id).all()
-    
-    # Group by receiver to create the receivers array
-    receivers = {}
-    
-    # Process all recipients
-    for recipient in recipients:
-        user = db.query(User).filter(User.id == recipient.user_id).first()
-        if not user:
-            continue
-        
-        username = user.username
-        if username not in receivers:
-            receivers[username] = {
-                "username": username,
+    transaction_ids = [transaction.id for transaction in transactions]
+    if not transaction_ids:
+        return []
+
+    # Group by transaction and receiver to create the receivers arrays
+    receivers_by_transaction = {transaction_id: {} for transaction_id in transaction_ids}
+    recipient_rows = (
+        db.query(
+            TransactionRecipient.transaction_id,
+            User.username,
+            TransactionRecipient.bucks,
+            TransactionRecipient.certs,
+            TransactionRecipient.lab,
+            TransactionRecipient.lec,
+            TransactionRecipient.sem,
+            TransactionRecipient.fac,
+        )
+        .join(User, User.id == TransactionRecipient.user_id)
+        .filter(TransactionRecipient.transaction_id.in_(transaction_ids))
+        .order_by(TransactionRecipient.id)
+        .all()
+    )
+    for row in recipient_rows:
+        receivers = receivers_by_transaction[row.transaction_id]
+        if row.username not in receivers:
+            receivers[row.username] = {
+                "username": row.username,
                 "bucks": 0,
                 "certs": 0,
                 "lab": 0,
@@ -39,61 +68,147 @@ def format_transaction_for_frontend(transaction: Transaction, db: Session) -> di
                 "sem": 0,
                 "fac": 0
             }
-        
+
         # Add all changes from this recipient
-        receivers[username]["bucks"] += recipient.bucks
-        receivers[username]["certs"] += recipient.certs
-        receivers[username]["lab"] += recipient.lab
-        receivers[username]["lec"] += recipient.lec
-        receivers[username]["sem"] += recipient.sem
-        receivers[username]["fac"] += recipient.fac
-    
-    # Format the transaction
-    return {
-        "id": transaction.id,
-        "author": transaction.creator.username,
-        "description": transaction.description,
-        "type": transaction.type.value,
-        "status": transaction.state.value,
-        "date_created": transaction.creation_timestamp.strftime("%Y-%m-%dT%H:%M:%S"),
-        "receivers": list(receivers.values())
-    }
-
-
-@router.get("/", response_model=List[dict])
+        receiver = receivers[row.username]
+        receiver["bucks"] += row.bucks
+        receiver["certs"] += row.certs
+        receiver["lab"] += row.lab
+        receiver["lec"] += row.lec
+        receiver["sem"] += row.sem
+        receiver["fac"] += row.fac
+
+    creator_ids = {transaction.creator_id for transaction in transactions}
+    creator_usernames = dict(
+        db.query(User.id, User.username).filter(User.id.in_(creator_ids)).all()
+    )
+
+    # Format the transactions
+    return [
+        {
+            "id": transaction.id,
+            "author": creator_usernames.get(transaction.creator_id),
+            "description": transaction.description,
+            "type": transaction.type.value,
+            "status": transaction.state.value,
+            "date_created": transaction.creation_timestamp.strftime("%Y-%m-%dT%H:%M:%S"),
+            "receivers": [
+                # Sums are exact Decimals, the frontend expects money as JSON numbers
+                {**receiver, "bucks": float(receiver["bucks"]), "certs": float(receiver["certs"])}
+                for receiver in receivers_by_transaction[transaction.id].values()
+            ]
+        }
+        for transaction in transactions
+    ]
+
+
+def format_transaction_for_frontend(transaction: Transaction, db: Session) -> dict:
+    """
+    Formats a Transaction object to match the frontend expected schema
+    """
+    return format_transactions_for_frontend([transaction], db)[0]
+
+
+def encode_cursor(transaction: Transaction) -> str:
+    """
+    Encode the (creation_timestamp, id) position of a transaction as an opaque cursor
+    """
+    position = f"{transaction.creation_timestamp.isoformat()}|{transaction.id}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Decode a cursor produced by encode_cursor
+    """
+    try:
+        created, transaction_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created), int(transaction_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        ) from None
+
+
+def list_transactions(
+    db: Session, current_user: User, skip: int = 0, limit: int = 100, cursor: Optional[str] = None
+) -> tuple[list[dict], Optional[str]]:
+    """
+    Get a page of transactions visible to the user, newest first, and the cursor of the next page.
+    With a cursor the page is found by keyset pagination on (creation_timestamp, id)
+    """
+    if limit < 1:
+        return [], None
+
+    query = db.query(Transaction)
+
+    # Staff and admins can see all transactions,
+    # regular users can see transactions where they are creator OR recipient
+    if not current_user.is_superuser and not current_user.is_staff:
+        visible_ids = union(
+            select(Transaction.id).where(Transaction.creator_id == current_user.id),
+            select(TransactionRecipient.transaction_id).where(TransactionRecipient.user_id == current_user.id),
+        )
+        query = query.filter(Transaction.id.in_(visible_ids))
+
+    if cursor:
+        query = query.filter(
+            tuple_(Transaction.creation_timestamp, Transaction.id) < tuple_(*decode_cursor(cursor))
+        )
+    elif skip:
+        query = query.offset(skip)
+
+    # Fetch one extra row to know whether there is a next page
+    transactions = (
+        query.order_by(Transaction.creation_timestamp.desc(), Transaction.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        next_cursor = encode_cursor(transactions[-1])
+
+    return format_transactions_for_frontend(transactions, db), next_cursor
+
+
+@router.get("/", response_model=list[dict])
 def read_transactions(
+    response: Response,
     db: Session = Depends(get_db),
-    skip: int = 0,
-    limit: int = 100,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
 ):
     """
-    Retrieve transactions.
-    """
-    # Staff and admins can see all transactions
-    if current_user.is_superuser or current_user.is_staff:
-        transactions = db.query(Transaction).offset(skip).limit(limit).all()
-    else:
-        # Regular users can see transactions where they are creator OR recipient
-        # Get transactions where user is creator
-        creator_transactions = db.query(Transaction).filter(
-            Transaction.creator_id == current_user.id
-        ).all()
-        
-        # Get transactions where user is recipient
-        recipient_transactions = db.query(Transaction).join(
-            TransactionRecipient, Transaction.id == TransactionRecipient.transaction_id
-        ).filter(
-            TransactionRecipient.user_id == current_user.id
-        ).all()
-        
-        # Combine and remove duplicates
-        all_transactions = list(set(creator_transactions + recipient_transactions))
-        # Sort by creation timestamp (newest first) and apply pagination
-        all_transactions.sort(key=lambda t: t.creation_timestamp, reverse=True)
-        transactions = all_transactions[skip:skip + limit]
-    
-    return [format_transaction_for_frontend(t, db) for t in transactions]
+    Retrieve transactions, newest first.
+    The cursor of the next page is returned in the X-Next-Cursor header.
+    """
+    transactions, next_cursor = list_transactions(db, current_user, skip, limit, cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return transactions
+
+
+@async_router.get("/", response_model=list[dict])
+async def read_transactions_async(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user_async),
+):
+    """
+    Retrieve transactions, newest first.
+    The cursor of the next page is returned in the X-Next-Cursor header.
+    """
+    transactions, next_cursor = await db.run_sync(list_transactions, current_user, skip, limit, cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return transactions
 
 
 @router.post("/")
@@ -136,10 +251,23 @@ def create_transaction_frontend(
     db: Session = Depends(get_db),
     transaction_data: dict,
     current_user: User = Depends(get_current_active_user),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
 ):
     """
     Create new transaction via frontend endpoint.
     This endpoint matches the frontend API expectations.
+    Retries with the same Idempotency-Key header return the first response.
+    """
+    return run_idempotent(
+        db, current_user.id, idempotency_key, "transactions/create", transaction_data,
+        lambda: create_transaction_for_user(db, transaction_data, current_user),
+    )
+
+
+def create_transaction_for_user(db: Session, transaction_data: dict, current_user: User) -> dict:
+    """
+    Create a transaction from frontend data, auto-processing it for staff.
+    Nothing is committed, run_idempotent commits it together with the stored response
     """
     logger.info(f"Received transaction create request from {current_user.username}")
     logger.info(f"Transaction data: {transaction_data}")
@@ -183,13 +311,14 @@ def create_transaction_frontend(
             description=description or "",
             recipients=recipients,
             update_of=transaction_data.get("update_of"),
-            db=db
+            db=db,
+            commit=False,
         )
         
         # If the creator is staff/superuser, automatically process the transaction
         if current_user.is_staff or current_user.is_superuser:
             logger.info(f"Auto-processing transaction {transaction.id} for staff user {current_user.username}")
-            transaction.process(db)
+            transaction.process(db, commit=False)
         
         # If this is an update transaction, decline/substitute the original
         update_of_id = transaction_data.get("update_of")
@@ -199,10 +328,10 @@ def create_transaction_frontend(
                 # If transaction is processed, substitute it; if created, decline it
                 if original_transaction.state.value == "processed":
                     logger.info(f"Substituting processed transaction {update_of_id} with new transaction {transaction.id}")
-                    original_transaction.substitute(db)
+                    original_transaction.substitute(db, commit=False)
                 elif original_transaction.state.value == "created":
                     logger.info(f"Declining created transaction {update_of_id} and creating replacement {transaction.id}")
-                    original_transaction.decline(db)
+                    original_transaction.decline(db, commit=False)
                 else:
                     logger.warning(f"Cannot replace transaction {update_of_id} in state {original_transaction.state.value}")
         
@@ -223,11 +352,24 @@ def create_seminar(
     db: Session = Depends(get_db),
     seminar_data: dict,
     current_user: User = Depends(get_current_active_user),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
 ):
     """
     Create a seminar as two transactions:
     1. Award points to the speaker based on evaluation
     2. Mark attendance for all attendees
+    Retries with the same Idempotency-Key header return the first response.
+    """
+    return run_idempotent(
+        db, current_user.id, idempotency_key, "transactions/seminar", seminar_data,
+        lambda: conduct_seminar(db, seminar_data, current_user),
+    )
+
+
+def conduct_seminar(db: Session, seminar_data: dict, current_user: User) -> dict:
+    """
+    Award the speaker and mark attendance of a seminar in one DB transaction.
+    Nothing is committed, run_idempotent commits it together with the stored response
     """
     # Only staff can create seminars
     if not current_user.is_staff and not current_user.is_superuser:
@@ -265,24 +407,30 @@ def create_seminar(
                     "username": speaker_username,
                     "amount": total_score
                 }],
-                db=db
+                db=db,
+                commit=False,
             )
             
             # Auto-process the transaction since it's created by staff
-            speaker_transaction.process(db)
+            speaker_transaction.process(db, commit=False)
             logger.info(f"Created speaker transaction {speaker_transaction.id} for {total_score} points")
         
         # Transaction 2: Mark seminar attendance for all attendees
         if attendees:
             # Create recipients for faculty attendance
-            attendance_recipients = []
-            for attendee_username in attendees:
-                attendee = db.query(User).filter(User.username == attendee_username).first()
-                if attendee:
-                    attendance_recipients.append({
-                        "username": attendee_username,
-                        "amount": 0  # No bucks for attendance, just counter increment
-                    })
+            # Resolve all attendees with one query, unknown usernames are skipped
+            existing_attendees = {
+                username for (username,) in
+                db.query(User.username).filter(User.username.in_(attendees)).all()
+            }
+            attendance_recipients = [
+                {
+                    "username": attendee_username,
+                    "amount": 0  # No bucks for attendance, just counter increment
+                }
+                for attendee_username in attendees
+                if attendee_username in existing_attendees
+            ]
             
             if attendance_recipients:
                 attendance_transaction = Transaction.new_transaction(
@@ -290,11 +438,12 @@ def create_seminar(
                     transaction_type=TransactionTypeEnum.fac_attend,
                     description=f"Посещение семинара '{description}' (блок {block})",
                     recipients=attendance_recipients,
-                    db=db
+                    db=db,
+                    commit=False,
                 )
                 
                 # Auto-process the attendance transaction
-                attendance_transaction.process(db)
+                attendance_transaction.process(db, commit=False)
                 logger.info(f"Created attendance transaction {attendance_transaction.id} for {len(attendees)} attendees")
         
         # Return success response
@@ -390,6 +539,14 @@ def process_transaction(
     try:
         transaction.process(db)
     except AttributeError as e:
+        # A concurrent or repeated request has already processed it
+        db.refresh(transaction)
+        if transaction.state != States.processed:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e),
+            ) from e
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e),
@@ -425,9 +582,12 @@ def decline_transaction(
     try:
         transaction.decline(db)
     except AttributeError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(e),
-        )
+        # A concurrent or repeated request has already declined it
+        db.refresh(transaction)
+        if transaction.state != States.declined:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e),
+            ) from e
     
     return format_transaction_for_frontend(transaction, db) 
\ No newline at end of file
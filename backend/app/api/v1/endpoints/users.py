@@ -1,30 +1,54 @@
-from typing import List
-import csv
+import asyncio
 import io
-from transliterate import translit
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks, Form
-from sqlalchemy.orm import Session
-from loguru import logger
+import json
+from collections.abc import AsyncIterator
 
-from app.db.session import get_db
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from loguru import logger
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+
+from app.api.v1.deps import (
+    get_async_db,
+    get_current_active_superuser,
+    get_current_active_user,
+    get_current_active_user_async,
+)
+from app.core.auth_cache import invalidate_auth
+from app.core.constants import FAC_NEEDED, LEC_NEEDED, SEM_NEEDED
+from app.core.media import avatar_urls, upload_avatar
+from app.core.security import get_password_hash, get_password_hash_async
+from app.core.user_import import (
+    DEFAULT_PASSWORD,
+    generate_username,
+    import_users_csv,
+    insert_users,
+    load_usernames,
+    user_row,
+)
+from app.db.session import SessionLocal, get_db
+from app.models.statistics_aggregate import StatisticsAggregate, statistics_party
 from app.models.user import User
 from app.schemas.user import (
     User as UserSchema,
-    UserCreate,
-    UserUpdate,
+)
+from app.schemas.user import (
     UserAdminUpdate,
-    UserListItem,
+    UserCreate,
     UserCSVImport,
+    UserListItem,
+    UserUpdate,
 )
-from app.api.v1.deps import get_current_active_user, get_current_active_superuser
-from app.core.constants import SEM_NEEDED, LEC_NEEDED, FAC_NEEDED
-from app.core.security import get_password_hash
-from app.core.media import upload_avatar, delete_avatar
 
 router = APIRouter()
+# Async versions of the read-heavy endpoints, registered when ASYNC_DB_ENABLED is set
+async_router = APIRouter()
 
 
-@router.get("/", response_model=List[UserListItem])
+@router.get("/", response_model=list[UserListItem])
 def read_users(
     db: Session = Depends(get_db),
     skip: int = 0,
@@ -51,6 +75,24 @@ def read_users(
         return [prepare_user_list_item(user) for user in users]
 
 
+@async_router.get("/", response_model=list[UserListItem])
+async def read_users_async(
+    db: AsyncSession = Depends(get_async_db),
+    skip: int = 0,
+    limit: int = 100,
+    current_user: User = Depends(get_current_active_user_async),
+):
+    """
+    Retrieve users. Staff can see all users, regular users can see only pioneers.
+    """
+    query = select(User).options(selectinload(User.badge))
+    if not current_user.is_staff and not current_user.is_superuser:
+        # Regular users (pioneers) can see only other pioneers (non-staff users)
+        query = query.where(User.is_staff == False, User.is_superuser == False)
+    users = (await db.execute(query.offset(skip).limit(limit))).scalars().all()
+    return [prepare_user_list_item(user) for user in users]
+
+
 @router.post("/", response_model=UserSchema)
 def create_user(
     *,
@@ -82,6 +124,7 @@ def create_user(
     )
 
     db.add(user)
+    StatisticsAggregate.move_user(db, user, None)
     db.commit()
     db.refresh(user)
 
@@ -99,6 +142,17 @@ def read_user_me(
     return prepare_user_schema(db, current_user)
 
 
+@async_router.get("/me", response_model=UserSchema)
+async def read_user_me_async(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async),
+):
+    """
+    Get current user.
+    """
+    return await db.run_sync(prepare_user_schema, current_user)
+
+
 @router.get("/{username}", response_model=UserSchema)
 def read_user_by_username(
     username: str,
@@ -160,6 +214,8 @@ def update_user(
             detail="Not enough permissions to change admin status",
         )
 
+    old_party = statistics_party(user)
+
     # Update user
     if user_in.password:
         user.hashed_password = get_password_hash(user_in.password)
@@ -186,8 +242,11 @@ def update_user(
     if user_in.position is not None:
         user.position = user_in.position
 
+    # Party and status changes move the user between statistics aggregates
+    StatisticsAggregate.move_user(db, user, old_party)
     db.commit()
     db.refresh(user)
+    invalidate_auth(user.id)
     return prepare_user_schema(db, user)
 
 
@@ -198,7 +257,6 @@ async def admin_update_user(
     username: str,
     user_data: str = Form(None),  # JSON string with user data
     avatar: UploadFile = File(None),  # Optional avatar file
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_active_superuser),
 ):
     """
@@ -218,7 +276,6 @@ async def admin_update_user(
     user_updates = None
     if user_data:
         try:
-            import json
             user_dict = json.loads(user_data)
             user_updates = UserAdminUpdate(**user_dict)
         except Exception as e:
@@ -227,6 +284,8 @@ async def admin_update_user(
                 detail=f"Invalid user data format: {str(e)}",
             )
 
+    old_party = statistics_party(user)
+
     # Update user fields if provided
     if user_updates:
         # Check if username is being changed and if it already exists
@@ -241,7 +300,7 @@ async def admin_update_user(
 
         # Update password if provided
         if user_updates.password:
-            user.hashed_password = get_password_hash(user_updates.password)
+            user.hashed_password = await get_password_hash_async(user_updates.password)
 
         # Update personal information
         if user_updates.first_name is not None:
@@ -281,11 +340,15 @@ async def admin_update_user(
             )
 
         # Upload new avatar
-        await upload_avatar(avatar, user.username, background_tasks)
+        user.avatar_hash = await upload_avatar(avatar, user.username, user.avatar_hash)
     logger.info(f"User {user.username} updated, updated fields: {user_updates}")
+    # Party and status changes move the user between statistics aggregates
+    if user_updates:
+        await run_in_threadpool(StatisticsAggregate.move_user, db, user, old_party)
     # Commit changes
     db.commit()
     db.refresh(user)
+    invalidate_auth(user.id)
     
     return prepare_user_schema(db, user)
 
@@ -297,7 +360,6 @@ async def update_user_avatar(
     username: str,
     avatar: UploadFile = File(...),
     current_user: User = Depends(get_current_active_user),
-    background_tasks: BackgroundTasks,
 ):
     """
     Update a user's avatar.
@@ -316,15 +378,8 @@ async def update_user_avatar(
             detail="Not enough permissions",
         )
 
-    # Delete old avatar if exists
-    if hasattr(user, 'avatar') and user.avatar:
-        background_tasks.add_task(delete_avatar, user.avatar)
-
-    # Upload new avatar
-    avatar_name = await upload_avatar(avatar, user.username)
-    
-    # Update user avatar
-    user.avatar = avatar_name
+    # Upload new avatar, files of the old one are deleted
+    user.avatar_hash = await upload_avatar(avatar, user.username, user.avatar_hash)
     db.commit()
     db.refresh(user)
     
@@ -337,7 +392,6 @@ async def admin_set_user_avatar(
     db: Session = Depends(get_db),
     target_username: str,
     file: UploadFile = File(...),
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_active_superuser),
 ):
     """
@@ -360,7 +414,9 @@ async def admin_set_user_avatar(
         )
     
     # Upload avatar using username
-    await upload_avatar(file, target_username, background_tasks)
+    user.avatar_hash = await upload_avatar(file, target_username, user.avatar_hash)
+    db.commit()
+    db.refresh(user)
     
     return prepare_user_schema(db, user)
 
@@ -370,33 +426,34 @@ def prepare_user_schema(db: Session, user: User) -> UserSchema:
     Prepare user data for schema serialization,
     adding calculated fields like expected_penalty and counters
     """
-    from app.schemas.user import CounterSchema
     from app.core.constants import AttendanceTypeEnum
+    from app.schemas.user import CounterSchema
 
-    # Calculate counters
+    # All attendance totals in one query
+    totals = user.get_counters(db)
     counters = []
 
     # Add lecture counter
-    lec_value = user.get_counter(AttendanceTypeEnum.lecture_attend.value, db)
+    lec_value = user.get_counter(AttendanceTypeEnum.lecture_attend.value, counters=totals)
     counters.append(
         CounterSchema(counter_name="lec", value=lec_value, max_value=LEC_NEEDED)
     )
 
     # Add seminar counter
-    sem_value = user.get_counter(AttendanceTypeEnum.seminar_attend.value, db)
+    sem_value = user.get_counter(AttendanceTypeEnum.seminar_attend.value, counters=totals)
     counters.append(
         CounterSchema(counter_name="sem", value=sem_value, max_value=SEM_NEEDED)
     )
 
     # Add lab counter
-    lab_value = user.get_counter(AttendanceTypeEnum.lab_pass.value, db)
+    lab_value = user.get_counter(AttendanceTypeEnum.lab_pass.value, counters=totals)
     lab_max = user.lab_needed()  # From user's configuration
     counters.append(
         CounterSchema(counter_name="lab", value=lab_value, max_value=lab_max)
     )
 
     # Add faculty counter
-    fac_value = user.get_counter(AttendanceTypeEnum.fac_attend.value, db)
+    fac_value = user.get_counter(AttendanceTypeEnum.fac_attend.value, counters=totals)
     counters.append(
         CounterSchema(counter_name="fac", value=fac_value, max_value=FAC_NEEDED)
     )
@@ -404,7 +461,7 @@ def prepare_user_schema(db: Session, user: User) -> UserSchema:
     # Calculate expected penalty (if not staff)
     expected_penalty = 0
     if not user.is_staff and not user.is_superuser:
-        expected_penalty = user.get_final_study_fine(db)
+        expected_penalty = user.get_final_study_fine(db, totals)
 
     # Create user dict
     user_dict = {
@@ -425,7 +482,7 @@ def prepare_user_schema(db: Session, user: User) -> UserSchema:
         "staff": user.is_staff,
         "expected_penalty": expected_penalty,
         "counters": counters,
-        "avatar": None,  # Add avatar implementation later
+        "avatar": avatar_urls(user.username, user.avatar_hash),
         "badge": user.badge.full_info_as_dict() if user.badge else None,
     }
 
@@ -443,45 +500,15 @@ def prepare_user_list_item(user: User) -> UserListItem:
         party=user.party,
         staff=user.is_staff,
         balance=user.balance,
+        avatar=avatar_urls(user.username, user.avatar_hash),
         badge=user.badge.full_info_as_dict() if user.badge else None,
     )
 
 
-def generate_username(
-    last_name: str, first_name: str, middle_name: str|None = None, db: Session = None
-) -> str:
-    # приведение к нижнему регистру
-    base = translit(last_name.strip().lower(), "ru", reversed=True).replace("'", "")
-    first_initial = translit(first_name.strip().lower()[0], "ru", reversed=True).replace("'", "")
-    middle_initial = translit(middle_name.strip().lower()[0] if middle_name else "", "ru", reversed=True).replace("'", "")
-
-    username = base
-    candidate = username
-    counter = 1
-
-    # этапы расширения
-    stages = [f"{base}.{first_initial}", f"{base}.{first_initial}.{middle_initial}"]
-
-    # проверяем базовое имя
-    if db.query(User).filter(User.username == candidate).first() is None:
-        return candidate
-
-    # проверяем с добавленными инициалами
-    for stage in stages:
-        if db.query(User).filter(User.username == stage).first() is None:
-            return stage
-
-    # если все занято, начинаем счет
-    while True:
-        candidate = f"{stages[-1]}{counter}"
-        if db.query(User).filter(User.username == candidate).first() is None:
-            return candidate
-        counter += 1
-
-
 @router.post("/import-csv")
 def import_users_from_csv(
     file: UploadFile = File(...),
+    dry_run: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_superuser),
 ):
@@ -492,108 +519,15 @@ def import_users_from_csv(
     username,first_name,last_name,middle_name,party,grade,is_staff,is_superuser,bio,position
 
     If username is not provided, it will be generated from name parts.
+    With dry_run the file is only validated and nothing is imported.
     """
     if not file.filename.endswith(".csv"):
         raise HTTPException(status_code=400, detail="File must be a CSV file")
 
     try:
-        # Read CSV content
-        content = file.file.read().decode("utf-8")
-        csv_reader = csv.DictReader(io.StringIO(content))
-
-        imported_users = []
-        errors = []
-
-        for row_num, row in enumerate(
-            csv_reader, start=2
-        ):  # Start from 2 because row 1 is header
-            try:
-                # Parse boolean fields
-                is_staff = row.get("is_staff", "false").lower() in ("true", "1", "yes")
-                is_superuser = row.get("is_superuser", "false").lower() in (
-                    "true",
-                    "1",
-                    "yes",
-                )
-
-                # Parse integer fields
-                party = int(row.get("party", 0)) if row.get("party") else 0
-                grade = int(row.get("grade", 0)) if row.get("grade") else 0
-
-                # Create user data
-                user_data = UserCSVImport(
-                    username=row.get("username"),
-                    last_name=row["last_name"].strip(),
-                    first_name=row["first_name"].strip(),
-                    middle_name=row.get("middle_name", "").strip()
-                    if row.get("middle_name")
-                    else None,
-                    party=party,
-                    grade=grade,
-                    is_staff=is_staff,
-                    is_superuser=is_superuser,
-                    bio=row.get("bio", "").strip() if row.get("bio") else None,
-                    position=row.get("position", "").strip()
-                    if row.get("position")
-                    else None,
-                )
-
-                # Generate username if not provided
-                if not user_data.username:
-                    user_data.username = generate_username(
-                        user_data.last_name,
-                        user_data.first_name,
-                        user_data.middle_name,
-                        db,
-                    )
-
-                # Check if username already exists
-                existing_user = (
-                    db.query(User).filter(User.username == user_data.username).first()
-                )
-                if existing_user:
-                    errors.append(
-                        f"Row {row_num}: Username '{user_data.username}' already exists"
-                    )
-                    continue
-
-                # Create user
-                user = User(
-                    username=user_data.username,
-                    hashed_password=get_password_hash(
-                        "r"
-                    ),  # Default password
-                    first_name=user_data.first_name,
-                    last_name=user_data.last_name,
-                    middle_name=user_data.middle_name,
-                    party=user_data.party,
-                    grade=user_data.grade,
-                    is_staff=user_data.is_staff,
-                    is_superuser=user_data.is_superuser,
-                    bio=user_data.bio,
-                    position=user_data.position,
-                )
-
-                db.add(user)
-                imported_users.append(user_data.username)
-
-            except Exception as e:
-                errors.append(f"Row {row_num}: {str(e)}")
-                continue
-
-        # Commit all changes
-        db.commit()
-
-        return {
-            "message": f"Successfully imported {len(imported_users)} users",
-            "imported_users": imported_users,
-            "errors": errors,
-            "total_rows_processed": len(csv_reader.fieldnames)
-            + len(imported_users)
-            + len(errors)
-            - 1,
-        }
-        
+        # Stream the CSV instead of reading the whole file into memory
+        lines = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+        return import_users_csv(db, lines, dry_run=dry_run)
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -604,11 +538,52 @@ def import_users_from_csv(
         file.file.close() 
 
 
+async def import_avatars(entries: list[tuple[UploadFile, str]]) -> AsyncIterator[dict]:
+    """
+    Process avatars of imported users in the media process pool.
+    Yields a progress event for every finished file
+    """
+    async def process(file: UploadFile, username: str):
+        try:
+            return username, await upload_avatar(file, username), None
+        except Exception as e:
+            return username, None, f"File {file.filename}: {e}"
+
+    tasks = [asyncio.ensure_future(process(file, username)) for file, username in entries]
+    for processed, task in enumerate(asyncio.as_completed(tasks), start=1):
+        username, avatar_hash, error = await task
+        yield {
+            "processed": processed,
+            "total": len(tasks),
+            "username": username,
+            "avatar_hash": avatar_hash,
+            "error": error,
+        }
+
+
+def save_avatar_hashes(avatar_hashes: dict[str, str]):
+    """
+    Record avatar hashes of imported users in one executemany UPDATE.
+    Uses its own session because a progress response is streamed after request dependencies are closed
+    """
+    statement = (
+        update(User.__table__)
+        .where(User.__table__.c.username == bindparam("b_username"))
+        .values(avatar_hash=bindparam("b_avatar_hash"))
+    )
+    with SessionLocal() as db:
+        db.connection().execute(
+            statement,
+            [{"b_username": username, "b_avatar_hash": avatar_hash} for username, avatar_hash in avatar_hashes.items()],
+        )
+        db.commit()
+
+
 @router.post("/import-images", status_code=201)
 async def import_users_from_images(
-    files: List[UploadFile] = File(...),
+    files: list[UploadFile] = File(...),
+    progress: bool = False,
     db: Session = Depends(get_db),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
     current_user: User = Depends(get_current_active_superuser),
 ):
     """
@@ -617,9 +592,13 @@ async def import_users_from_images(
     username,last_name,first_name,middle_name,party,grade,is_staff,is_superuser,bio,position.jpg
     
     Empty values can be represented by leaving the field blank (e.g., username,,first_name)
+
+    With progress=true the response is streamed as NDJSON: one line per processed
+    image and the import report as the last line.
     """
-    imported_users = []
     errors = []
+    users = []
+    taken = await run_in_threadpool(load_usernames, db)
     
     for file in files:
         try:
@@ -638,72 +617,83 @@ async def import_users_from_images(
                 continue
                 
             # Extract data from filename
-            user_data = {
-                "username": filename_parts[0].strip() if filename_parts[0].strip() else None,
-                "last_name": filename_parts[1].strip() if len(filename_parts) > 1 and filename_parts[1].strip() else "",
-                "first_name": filename_parts[2].strip() if len(filename_parts) > 2 and filename_parts[2].strip() else "",
-                "middle_name": filename_parts[3].strip() if len(filename_parts) > 3 and filename_parts[3].strip() else None,
-                "party": int(filename_parts[4]) if len(filename_parts) > 4 and filename_parts[4].strip() else 0,
-                "grade": int(filename_parts[5]) if len(filename_parts) > 5 and filename_parts[5].strip() else 0,
-                "is_staff": filename_parts[6].lower() in ("true", "1", "yes") if len(filename_parts) > 6 and filename_parts[6].strip() else False,
-                "is_superuser": filename_parts[7].lower() in ("true", "1", "yes") if len(filename_parts) > 7 and filename_parts[7].strip() else False,
-                "bio": filename_parts[8].strip() if len(filename_parts) > 8 and filename_parts[8].strip() else None,
-                "position": filename_parts[9].strip() if len(filename_parts) > 9 and filename_parts[9].strip() else None
-            }
+            user_data = UserCSVImport(
+                username=filename_parts[0].strip() or None,
+                last_name=filename_parts[1].strip() if len(filename_parts) > 1 and filename_parts[1].strip() else "",
+                first_name=filename_parts[2].strip() if len(filename_parts) > 2 and filename_parts[2].strip() else "",
+                middle_name=filename_parts[3].strip() if len(filename_parts) > 3 and filename_parts[3].strip() else None,
+                party=int(filename_parts[4]) if len(filename_parts) > 4 and filename_parts[4].strip() else 0,
+                grade=int(filename_parts[5]) if len(filename_parts) > 5 and filename_parts[5].strip() else 0,
+                is_staff=filename_parts[6].lower() in ("true", "1", "yes") if len(filename_parts) > 6 and filename_parts[6].strip() else False,
+                is_superuser=filename_parts[7].lower() in ("true", "1", "yes") if len(filename_parts) > 7 and filename_parts[7].strip() else False,
+                bio=filename_parts[8].strip() if len(filename_parts) > 8 and filename_parts[8].strip() else None,
+                position=filename_parts[9].strip() if len(filename_parts) > 9 and filename_parts[9].strip() else None
+            )
             
             # Generate username if not provided
-            if not user_data["username"]:
-                user_data["username"] = generate_username(
-                    user_data["last_name"],
-                    user_data["first_name"],
-                    user_data["middle_name"],
-                    db
+            if not user_data.username:
+                user_data.username = generate_username(
+                    user_data.last_name,
+                    user_data.first_name,
+                    user_data.middle_name,
+                    taken
                 )
-                
             # Check if user already exists
-            existing_user = db.query(User).filter(User.username == user_data["username"]).first()
-            if existing_user:
-                errors.append(f"File {file.filename}: Username '{user_data['username']}' already exists")
+            elif user_data.username in taken:
+                errors.append(f"File {file.filename}: Username '{user_data.username}' already exists")
                 continue
-                
-            # Create user
-            new_user = User(
-                username=user_data["username"],
-                hashed_password=get_password_hash("r"),  # Default password
-                first_name=user_data["first_name"],
-                last_name=user_data["last_name"],
-                middle_name=user_data["middle_name"],
-                party=user_data["party"],
-                grade=user_data["grade"],
-                is_staff=user_data["is_staff"],
-                is_superuser=user_data["is_superuser"],
-                bio=user_data["bio"],
-                position=user_data["position"]
-            )
-            
-            db.add(new_user)
-            db.flush()  # Get user ID without committing
-            
-            # Save and process avatar
-            await upload_avatar(file, user_data["username"], background_tasks)
-            
-            imported_users.append(user_data["username"])
+            taken.add(user_data.username)
+            users.append((file, user_data))
             
         except Exception as e:
             errors.append(f"File {file.filename}: {str(e)}")
             continue
     
-    # Commit all changes
-    try:
-        db.commit()
-        return {
-            "message": f"Successfully imported {len(imported_users)} users with avatars",
+    # Create all users in batches before processing their avatars
+    if users:
+        hashed_password = await get_password_hash_async(DEFAULT_PASSWORD)
+        rows = [user_row(user_data, hashed_password) for _, user_data in users]
+        try:
+            await run_in_threadpool(insert_users, db, rows)
+            await run_in_threadpool(db.commit)
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error importing users: {e}"
+            ) from e
+
+    entries = [(file, user_data.username) for file, user_data in users]
+
+    async def run_import():
+        # Every user in entries is committed, errors only lists files that created no user
+        avatar_hashes = {}
+        avatar_errors = []
+        async for event in import_avatars(entries):
+            if event["error"]:
+                avatar_errors.append(event["error"])
+            else:
+                avatar_hashes[event["username"]] = event["avatar_hash"]
+            yield event
+        if avatar_hashes:
+            await run_in_threadpool(save_avatar_hashes, avatar_hashes)
+        imported_users = [username for _, username in entries]
+        yield {
+            "message": f"Successfully imported {len(imported_users)} users, {len(avatar_hashes)} with avatars",
             "imported_users": imported_users,
+            "users_without_avatar": [username for username in imported_users if username not in avatar_hashes],
             "errors": errors,
+            "avatar_errors": avatar_errors,
         }
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=500, 
-            detail=f"Error importing users: {str(e)}"
-        ) 
\ No newline at end of file
+
+    if progress:
+        return StreamingResponse(
+            (json.dumps(event, ensure_ascii=False) + "\n" async for event in run_import()),
+            status_code=201,
+            media_type="application/x-ndjson",
+        )
+
+    report = None
+    async for report in run_import():  # noqa: B007 - the last event is the report
+        pass
+    return report
@@ -0,0 +1,56 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+
+@dataclass(frozen=True)
+class AuthSnapshot:
+    """Immutable snapshot of the user fields that permission checks depend on"""
+    user_id: int
+    is_active: bool
+    is_staff: bool
+    is_superuser: bool
+
+    @classmethod
+    def from_user(cls, user) -> "AuthSnapshot":
+        return cls(
+            user_id=user.id,
+            is_active=user.is_active,
+            is_staff=user.is_staff,
+            is_superuser=user.is_superuser,
+        )
+
+
+@dataclass(frozen=True)
+class AuthCacheEntry:
+    """Last verified token of a user with its decoded claims and the user snapshot"""
+    token: str
+    claims: dict
+    snapshot: AuthSnapshot
+
+
+# Authenticated users keyed by user id, per worker process
+auth_cache = TTLCache(settings.AUTH_CACHE_MAX_SIZE, settings.AUTH_CACHE_TTL_SECONDS)
+
+
+def get_cached_auth(user_id: int) -> Optional[AuthCacheEntry]:
+    """
+    Get the cached authentication entry of a user
+    """
+    return auth_cache.get(user_id)
+
+
+def cache_auth(token: str, claims: dict, snapshot: AuthSnapshot):
+    """
+    Remember a verified token and the user snapshot
+    """
+    auth_cache.put(snapshot.user_id, AuthCacheEntry(token=token, claims=claims, snapshot=snapshot))
+
+
+def invalidate_auth(user_id: int):
+    """
+    Forget the cached snapshot after the user's auth-relevant fields change
+    """
+    auth_cache.pop(user_id)
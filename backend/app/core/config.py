@@ -1,7 +1,8 @@
 import os
-from pydantic_settings import BaseSettings
-from typing import Optional, List
+from typing import Optional
+
 from dotenv import load_dotenv
+from pydantic_settings import BaseSettings
 
 load_dotenv()
 
@@ -17,12 +18,70 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = os.environ.get("POSTGRES_DB", "lfmsh_bank")
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
 
+    # Connection pool
+    DB_POOL_SIZE: int = int(os.environ.get("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: int = int(os.environ.get("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = int(os.environ.get("DB_POOL_RECYCLE", "1800"))  # seconds before a connection is replaced
+    DB_POOL_PRE_PING: bool = os.environ.get("DB_POOL_PRE_PING", "True").lower() == "true"
+    DB_STATEMENT_TIMEOUT_MS: int = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 disables the timeout
+    # Connect through PgBouncer in transaction pooling mode
+    DB_PGBOUNCER_MODE: bool = os.environ.get("DB_PGBOUNCER_MODE", "False").lower() == "true"
+
+    # Optional async stack (asyncpg) for the read-heavy endpoints, install with the async extra
+    ASYNC_DB_ENABLED: bool = os.environ.get("ASYNC_DB_ENABLED", "False").lower() == "true"
+    ASYNC_SQLALCHEMY_DATABASE_URI: Optional[str] = None
+
     # JWT
     SECRET_KEY: str = os.environ.get("SECRET_KEY", "secret_key_for_dev_only")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 1 week
     
+    # Password hashing
+    BCRYPT_ROUNDS: int = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS: int = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_QUEUE: int = int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", "64"))
+    PASSWORD_HASH_QUEUE_TIMEOUT: float = float(os.environ.get("PASSWORD_HASH_QUEUE_TIMEOUT", "10"))
+
+    # Cache of authenticated users, per worker process
+    AUTH_CACHE_TTL_SECONDS: int = int(os.environ.get("AUTH_CACHE_TTL_SECONDS", "30"))
+    AUTH_CACHE_MAX_SIZE: int = int(os.environ.get("AUTH_CACHE_MAX_SIZE", "2048"))
+
+    # Upload limits: whole request body, single image file and decoded image pixels
+    MAX_UPLOAD_SIZE: int = int(os.environ.get("MAX_UPLOAD_SIZE", str(100 * 1024 * 1024)))
+    MAX_IMAGE_SIZE: int = int(os.environ.get("MAX_IMAGE_SIZE", str(20 * 1024 * 1024)))
+    MAX_IMAGE_PIXELS: int = int(os.environ.get("MAX_IMAGE_PIXELS", "40000000"))
+
+    # Image processing: worker processes and uploads processed at once
+    MEDIA_WORKERS: int = int(os.environ.get("MEDIA_WORKERS", str(os.cpu_count() or 1)))
+    MEDIA_MAX_CONCURRENCY: int = int(os.environ.get("MEDIA_MAX_CONCURRENCY", str(2 * (os.cpu_count() or 1))))
+    # Disk space of the on-demand thumbnail cache
+    THUMBNAIL_CACHE_MAX_BYTES: int = int(os.environ.get("THUMBNAIL_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+    # Also encode AVIF, needs a Pillow build with AVIF support
+    MEDIA_AVIF_ENABLED: bool = os.environ.get("MEDIA_AVIF_ENABLED", "False").lower() == "true"
+
+    # Built-in scheduler of the daily tax and recurring transactions
+    SCHEDULER_ENABLED: bool = os.environ.get("SCHEDULER_ENABLED", "False").lower() == "true"
+    SCHEDULER_TIMEZONE: str = os.environ.get("SCHEDULER_TIMEZONE", "Europe/Moscow")
+    SCHEDULER_INTERVAL_SECONDS: int = int(os.environ.get("SCHEDULER_INTERVAL_SECONDS", "60"))
+    # Scheduled transactions are created on behalf of this user
+    SCHEDULER_CREATOR_USERNAME: str = os.environ.get("SCHEDULER_CREATOR_USERNAME", "bank")
+    # HH:MM in SCHEDULER_TIMEZONE, empty disables the scheduled daily tax
+    DAILY_TAX_TIME: str = os.environ.get("DAILY_TAX_TIME", "03:00")
+    # JSON list of templates paid to all pioneers every day:
+    # [{"name": "workout", "type": "workout", "amount": 5, "time": "07:30", "description": "Зарядка"}]
+    RECURRING_TRANSACTIONS: str = os.environ.get("RECURRING_TRANSACTIONS", "[]")
+
+    # Rows every statistics aggregate is split into, so concurrent transactions rarely share one
+    STATISTICS_SHARDS: int = int(os.environ.get("STATISTICS_SHARDS", "16"))
+    # Width of the balance histogram buckets, the median and percentiles are interpolated inside one
+    STATISTICS_BALANCE_BUCKET: int = int(os.environ.get("STATISTICS_BALANCE_BUCKET", "10"))
+
     # CORS
-    BACKEND_CORS_ORIGINS: List[str] = ["*"]
+    BACKEND_CORS_ORIGINS: list[str] = ["*"]
+
+    # Idempotency-Key support for transaction creation
+    IDEMPOTENCY_CACHE_SIZE: int = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "1024"))
+    IDEMPOTENCY_KEY_TTL_HOURS: int = int(os.environ.get("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
     
     # Test mode
     TEST_MODE: bool = os.environ.get("TEST_MODE", "False").lower() == "true"
@@ -35,6 +94,7 @@ class Settings(BaseSettings):
         
         # Build DB connection string
         self.SQLALCHEMY_DATABASE_URI = f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}/{self.POSTGRES_DB}"
+        self.ASYNC_SQLALCHEMY_DATABASE_URI = f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}/{self.POSTGRES_DB}"
 
 
 settings = Settings() 
\ No newline at end of file
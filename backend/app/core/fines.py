@@ -0,0 +1,91 @@
+from dataclasses import dataclass
+
+import numpy as np
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+import app.core.constants as c
+
+# Grade of pioneers whose grade is not set
+NO_GRADE = -1
+
+
+def obligatory_study_fine(deficit):
+    """
+    Fine for missing obligatory study: the first missed one costs INITIAL_STEP_OBL_STD
+    and every next one STEP_OBL_STD more. Closed form of the arithmetic series,
+    works for a single deficit and for NumPy arrays
+    """
+    return deficit * c.INITIAL_STEP_OBL_STD + c.STEP_OBL_STD * deficit * (deficit - 1) // 2
+
+
+def needed_by_grade(grades: np.ndarray, needed: dict[int, int], default: int) -> np.ndarray:
+    """
+    Vectorized dict.get(grade, default)
+    """
+    result = np.full(grades.shape, default, dtype=np.int64)
+    for grade, value in needed.items():
+        result[grades == grade] = value
+    return result
+
+
+@dataclass
+class PioneerCounters:
+    """Attendance totals of all active pioneers as parallel arrays"""
+    user_ids: np.ndarray
+    grades: np.ndarray
+    lab: np.ndarray
+    sem: np.ndarray
+    fac: np.ndarray
+
+    @classmethod
+    def load(cls, db: Session) -> "PioneerCounters":
+        """
+        Sum counted attendance of every active pioneer in one grouped query
+        """
+        from app.models.transaction import TransactionRecipient
+        from app.models.user import User
+
+        rows = db.execute(
+            select(
+                User.id,
+                # A NULL grade matches no grade in the lookups, like dict.get(None, default)
+                func.coalesce(User.grade, NO_GRADE),
+                func.coalesce(func.sum(TransactionRecipient.lab), 0),
+                func.coalesce(func.sum(TransactionRecipient.sem), 0),
+                func.coalesce(func.sum(TransactionRecipient.fac), 0),
+            )
+            .outerjoin(
+                TransactionRecipient,
+                and_(TransactionRecipient.user_id == User.id, TransactionRecipient.counted),
+            )
+            .where(User.is_active == True, User.is_staff == False, User.is_superuser == False)
+            .group_by(User.id, User.grade)
+            .order_by(User.id)
+        ).all()
+
+        columns = np.array(rows, dtype=np.int64).reshape(-1, 5).T
+        user_ids, grades, lab, sem, fac = columns
+        return cls(user_ids=user_ids, grades=grades, lab=lab, sem=sem, fac=fac)
+
+
+def final_study_fines(counters: PioneerCounters) -> np.ndarray:
+    """
+    Vectorized User.get_final_study_fine for all pioneers
+    """
+    sem_fine = c.SEM_NOT_READ_PEN * np.maximum(0, 1 - counters.sem)
+    obl_deficit = np.maximum(0, c.OBL_STUDY_NEEDED - (counters.sem + counters.fac))
+    lab_needed = needed_by_grade(counters.grades, c.LAB_NEEDED, 2)
+    lab_fine = np.maximum(0, lab_needed - counters.lab) * c.LAB_PENALTY
+    fac_needed = needed_by_grade(counters.grades, c.FAC_PASS_NEEDED, 1)
+    fac_fine = np.maximum(0, fac_needed - counters.fac) * c.FAC_PENALTY
+    return sem_fine + obligatory_study_fine(obl_deficit) + lab_fine + fac_fine
+
+
+def equator_study_fines(counters: PioneerCounters) -> np.ndarray:
+    """
+    Vectorized User.get_equator_study_fine for all pioneers
+    """
+    obl_deficit = np.maximum(0, c.OBL_STUDY_NEEDED_EQUATOR - (counters.sem + counters.fac))
+    lab_fine = np.maximum(0, c.LAB_PASS_NEEDED_EQUATOR - counters.lab) * c.LAB_PENALTY
+    return obligatory_study_fine(obl_deficit) + lab_fine
@@ -0,0 +1,133 @@
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.idempotency_key import IdempotencyKey
+
+# Header the client sends to make a write request safe to retry
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+# Completed responses keyed by (user_id, key, endpoint, fingerprint)
+response_cache = TTLCache(
+    settings.IDEMPOTENCY_CACHE_SIZE, settings.IDEMPOTENCY_KEY_TTL_HOURS * 3600
+)
+
+
+def request_fingerprint(request_data: Any) -> str:
+    """
+    Hash of the request body, so a key reused with a different request is rejected
+    """
+    encoded = json.dumps(jsonable_encoder(request_data), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _find_key(db: Session, user_id: int, key: str) -> Optional[IdempotencyKey]:
+    return db.query(IdempotencyKey).filter(
+        IdempotencyKey.user_id == user_id, IdempotencyKey.key == key
+    ).first()
+
+
+def _is_expired(record: IdempotencyKey) -> bool:
+    created_at = record.created_at
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS) <= datetime.now(timezone.utc)
+
+
+def _stored_response(record: IdempotencyKey, endpoint: str, fingerprint: str) -> dict:
+    if record.endpoint != endpoint or record.fingerprint != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="This idempotency key was already used for a different request",
+        )
+    if record.response is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this idempotency key is still in progress",
+        )
+    return record.response
+
+
+def begin_request(db: Session, user_id: int, key: str, endpoint: str, fingerprint: str) -> Optional[dict]:
+    """
+    Reserve an idempotency key in the current DB transaction.
+    Returns the stored response if the key was already used, None if the request should run.
+    The reservation is committed only together with the work and its response
+    """
+    cache_key = (user_id, key, endpoint, fingerprint)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    record = _find_key(db, user_id, key)
+    if record is not None:
+        if not _is_expired(record):
+            response = _stored_response(record, endpoint, fingerprint)
+            response_cache.put(cache_key, response)
+            return response
+        # Expired keys can be reused. Delete the old row before the new one is inserted,
+        # a unit of work flush would run the INSERT first and hit the unique constraint
+        db.execute(delete(IdempotencyKey).where(IdempotencyKey.id == record.id))
+        db.expunge(record)
+
+    try:
+        # A concurrent request with the same key blocks here until its DB transaction ends
+        with db.begin_nested():
+            db.add(IdempotencyKey(user_id=user_id, key=key, endpoint=endpoint, fingerprint=fingerprint))
+    except IntegrityError:
+        # The concurrent request has committed its work and response first
+        response = _stored_response(_find_key(db, user_id, key), endpoint, fingerprint)
+        response_cache.put(cache_key, response)
+        return response
+    return None
+
+
+def complete_request(db: Session, user_id: int, key: str, response: dict):
+    """
+    Store the response of a request made with an idempotency key, in the DB transaction of its work
+    """
+    db.query(IdempotencyKey).filter(
+        IdempotencyKey.user_id == user_id, IdempotencyKey.key == key
+    ).update({IdempotencyKey.response: response}, synchronize_session=False)
+
+
+def run_idempotent(
+    db: Session, user_id: int, key: Optional[str], endpoint: str, request_data: Any,
+    handler: Callable[[], dict],
+) -> dict:
+    """
+    Run a write handler in one DB transaction, at most once per idempotency key.
+    The handler must not commit: its work, the key and the response are committed together,
+    so a failure or a crash leaves nothing behind and the request can simply be retried.
+    A repeated key returns the stored response without running the handler again
+    """
+    fingerprint = request_fingerprint(request_data)
+    try:
+        if key:
+            stored = begin_request(db, user_id, key, endpoint, fingerprint)
+            if stored is not None:
+                db.rollback()
+                logger.info(f"Returning stored response for idempotency key {key} of user {user_id}")
+                return stored
+
+        response = jsonable_encoder(handler())
+        if key:
+            complete_request(db, user_id, key, response)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    if key:
+        response_cache.put((user_id, key, endpoint, fingerprint), response)
+    return response
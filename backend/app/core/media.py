@@ -1,19 +1,32 @@
-import os
-import shutil
-from PIL import Image
-from fastapi import UploadFile, BackgroundTasks
+import asyncio
+import hashlib
+import io
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Tuple
+from typing import Optional
+from urllib.parse import quote
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image, UnidentifiedImageError
+
+from app.core.config import settings
+from app.core.upload_limit import upload_too_large
 
 # Define paths for media storage
 MEDIA_ROOT = Path("/var/www/media")
+MEDIA_URL = "/media/"
 AVATAR_ROOT = MEDIA_ROOT / "avatars"
 BADGE_ROOT = MEDIA_ROOT / "badges"
+# On-demand thumbnails rendered from the stored originals
+THUMBNAIL_ROOT = MEDIA_ROOT / "thumbnails"
 
 # Ensure directories exist
 MEDIA_ROOT.mkdir(exist_ok=True)
 AVATAR_ROOT.mkdir(exist_ok=True)
 BADGE_ROOT.mkdir(exist_ok=True)
+THUMBNAIL_ROOT.mkdir(exist_ok=True)
 
 # Define avatar sizes
 AVATAR_SIZES = {
@@ -31,245 +44,346 @@ BADGE_SIZES = {
     "original": None  # Original size is preserved
 }
 
-async def save_avatar(upload: UploadFile, username: str) -> str:
-    """
-    Save an uploaded avatar using the username as filename
-    Returns the base filename (without extension)
-    """
-    # Always use PNG format
-    filename = f"{username}.png"
-    
-    # Create full path
-    file_path = AVATAR_ROOT / filename
-    
-    # Ensure folder exists
-    AVATAR_ROOT.mkdir(exist_ok=True, parents=True)
-    
-    # Save the uploaded file temporarily
-    temp_path = AVATAR_ROOT / f"temp_{filename}"
-    with open(temp_path, "wb") as buffer:
-        shutil.copyfileobj(upload.file, buffer)
-    
-    # Convert to PNG and save as original, cropping to square
-    try:
-        img = Image.open(temp_path)
-        
-        # Crop to square
-        width, height = img.size
-        if width != height:
-            # Calculate dimensions for center crop
-            size = min(width, height)
-            left = (width - size) // 2
-            top = (height - size) // 2
-            right = left + size
-            bottom = top + size
-            
-            # Crop the image
-            img = img.crop((left, top, right, bottom))
-        
-        # Save the square image
-        img.save(file_path, "PNG")
-    finally:
-        # Clean up temp file
-        if temp_path.exists():
-            os.remove(temp_path)
-    
-    return username
-
-def generate_avatar_variants(username: str, sizes: dict = AVATAR_SIZES) -> List[Tuple[str, Tuple[int, int]]]:
-    """
-    Generate different sized variants of an avatar
-    Returns a list of (filename, size) tuples for created files
-    """
-    generated_files = []
-    original_path = AVATAR_ROOT / f"{username}.png"
-    
-    # Check if original file exists
-    if not original_path.exists():
-        return []
-    
-    # Load the original image
-    img = Image.open(original_path)
-    
-    # Process for each size
-    for size_name, dimensions in sizes.items():
-        if dimensions is None:  # Skip resizing for "original"
-            continue
-            
-        # Create a resized copy
-        resized_img = img.copy()
-        resized_img.thumbnail(dimensions, Image.LANCZOS)
-        
-        # Create the variant filename with size suffix
-        variant_filename = f"{username}_{size_name}.png"
-        variant_path = AVATAR_ROOT / variant_filename
-        
-        # Save the variant as PNG
-        resized_img.save(variant_path, "PNG")
-        generated_files.append((variant_filename, dimensions))
-    
-    return generated_files
-
-def process_avatar_background(username: str):
-    """
-    Process avatar in a background task
-    Generates different sizes of avatars
-    """
-    try:
-        # Generate all avatar variants
-        generate_avatar_variants(username)
-    except Exception as e:
-        # Log error in background task
-        print(f"Error processing avatar variants: {e}")
-
-async def upload_avatar(upload: UploadFile, username: str, background_tasks: BackgroundTasks) -> None:
-    """
-    Save avatar with username and schedule background processing for variants
-    """
-    # Save the original file
-    await save_avatar(upload, username)
-    
-    # Schedule background processing
-    background_tasks.add_task(process_avatar_background, username)
-
-def delete_avatar(username: str):
+# Hex digits of the content hash in versioned filenames
+CONTENT_HASH_LENGTH = 16
+
+# Uploads are read and media files written in chunks of this size
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Uploads are cropped to square and stored at most this large
+MAX_ORIGINAL_SIZE = 1024
+
+# Output formats: extension -> (Pillow format, save options).
+# PNG stays for old clients, nginx serves WebP/AVIF to browsers that accept them
+IMAGE_FORMATS = {
+    "png": ("PNG", {}),
+    "webp": ("WEBP", {"quality": 82, "method": 4}),
+    "avif": ("AVIF", {"quality": 60, "speed": 8}),
+}
+
+
+def output_formats() -> list[str]:
+    """
+    Formats to encode, AVIF only if enabled and supported by the Pillow build
+    """
+    formats = ["png", "webp"]
+    if settings.MEDIA_AVIF_ENABLED:
+        Image.init()
+        if "AVIF" in Image.SAVE:
+            formats.append("avif")
+    return formats
+
+
+# Decoding and encoding images is CPU-bound, it runs in worker processes
+_media_pool: Optional[ProcessPoolExecutor] = None
+# Uploads being processed at once, bounds the memory held by pending images
+media_slots = asyncio.Semaphore(settings.MEDIA_MAX_CONCURRENCY)
+
+
+def get_media_pool() -> ProcessPoolExecutor:
+    """
+    Get the image processing pool, created on first use
+    """
+    global _media_pool
+    if _media_pool is None:
+        _media_pool = ProcessPoolExecutor(max_workers=settings.MEDIA_WORKERS)
+    return _media_pool
+
+
+def shutdown_media_pool():
+    """
+    Stop the image processing workers
+    """
+    global _media_pool
+    if _media_pool is not None:
+        _media_pool.shutdown(wait=False, cancel_futures=True)
+        _media_pool = None
+
+
+def crop_to_square(img: Image.Image) -> Image.Image:
+    """
+    Center crop an image to a square
+    """
+    width, height = img.size
+    if width == height:
+        return img
+    size = min(width, height)
+    left = (width - size) // 2
+    top = (height - size) // 2
+    return img.crop((left, top, left + size, top + size))
+
+
+def downscale(img: Image.Image, size: int) -> Image.Image:
+    """
+    Downscale a square image to size x size, never upscales.
+    reduce() takes the cheap integer steps, LANCZOS only does the last one
+    """
+    if img.width <= size:
+        return img
+    factor = img.width // (2 * size)
+    if factor > 1:
+        img = img.reduce(factor)
+    return img.resize((size, size), Image.LANCZOS)
+
+
+def check_image_dimensions(img: Image.Image):
+    """
+    Reject images with more pixels than MAX_IMAGE_PIXELS before decoding them.
+    Raises ValueError, HTTPException can't be sent back from the process pool
+    """
+    if img.width * img.height > settings.MAX_IMAGE_PIXELS:
+        raise ValueError(f"Image is too large: {img.width}x{img.height}")
+
+
+def decode_image(data: bytes) -> Image.Image:
+    """
+    Decode an upload into a square RGB(A) image of at most MAX_ORIGINAL_SIZE.
+    JPEG is decoded straight at a reduced scale with draft()
+    """
+    img = Image.open(io.BytesIO(data))
+    check_image_dimensions(img)
+    if img.format == "JPEG":
+        img.draft("RGB", (MAX_ORIGINAL_SIZE, MAX_ORIGINAL_SIZE))
+    has_alpha = "A" in img.getbands() or "transparency" in img.info
+    img = img.convert("RGBA" if has_alpha else "RGB")
+    return downscale(crop_to_square(img), MAX_ORIGINAL_SIZE)
+
+
+def encode_image(img: Image.Image, image_format: str) -> bytes:
+    pil_format, options = IMAGE_FORMATS[image_format]
+    buffer = io.BytesIO()
+    img.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:CONTENT_HASH_LENGTH]
+
+
+def render_variants(data: bytes, sizes: dict) -> tuple[str, dict[tuple[str, str], bytes]]:
+    """
+    Decode an upload once and encode it and all its sized variants in every output format.
+    Sizes are made from a cascade: each one is downscaled from the previous, smaller image.
+    Pure function of its arguments, runs in the media process pool.
+    Returns the content hash of the upload and {(size_name, format): encoded bytes}
+    """
+    current = decode_image(data)
+    images = {"original": current}
+    sized = sorted(
+        ((name, dimensions) for name, dimensions in sizes.items() if dimensions is not None),
+        key=lambda item: item[1][0],
+        reverse=True,
+    )
+    for size_name, dimensions in sized:
+        current = downscale(current, dimensions[0])
+        images[size_name] = current
+
+    return content_hash(data), {
+        (size_name, image_format): encode_image(img, image_format)
+        for size_name, img in images.items()
+        for image_format in output_formats()
+    }
+
+
+def render_thumbnail(data: bytes, size: int, image_format: str) -> bytes:
+    """
+    Render one square thumbnail of a stored original.
+    Pure function of its arguments, runs in the media process pool
+    """
+    img = Image.open(io.BytesIO(data))
+    if img.format == "JPEG":
+        img.draft("RGB", (size, size))
+    has_alpha = "A" in img.getbands() or "transparency" in img.info
+    img = img.convert("RGBA" if has_alpha else "RGB")
+    return encode_image(downscale(crop_to_square(img), size), image_format)
+
+
+def variant_filename(name: str, size_name: str, image_format: str, version: Optional[str] = None) -> str:
+    """
+    name[_size][.version].format, the version is the content hash
+    """
+    stem = name if size_name == "original" else f"{name}_{size_name}"
+    if version:
+        stem = f"{stem}.{version}"
+    return f"{stem}.{image_format}"
+
+
+async def write_file(path: Path, data: bytes):
+    """
+    Write a file in chunks without blocking the event loop
+    """
+    async with aiofiles.open(path, "wb") as file:
+        for start in range(0, len(data), UPLOAD_CHUNK_SIZE):
+            await file.write(data[start:start + UPLOAD_CHUNK_SIZE])
+
+
+async def write_variants(root: Path, name: str, version: str, variants: dict[tuple[str, str], bytes]):
+    """
+    Write rendered variants under content-hashed names and point the stable
+    names (name[_size].format) at them with symlinks
+    """
+    await aiofiles.os.makedirs(root, exist_ok=True)
+    for (size_name, image_format), data in variants.items():
+        filename = variant_filename(name, size_name, image_format, version)
+        await write_file(root / filename, data)
+
+        # Replace the stable name atomically
+        link = root / variant_filename(name, size_name, image_format)
+        temp_link = root / f".{link.name}.tmp"
+        if await aiofiles.os.path.islink(temp_link) or await aiofiles.os.path.exists(temp_link):
+            await aiofiles.os.remove(temp_link)
+        await aiofiles.os.symlink(filename, temp_link)
+        await aiofiles.os.replace(temp_link, link)
+
+
+async def delete_variants(root: Path, name: str, sizes: dict, version: Optional[str] = None, stable: bool = True):
+    """
+    Delete the original and all size variants in every format.
+    version deletes the files of that content hash, stable the stable names
+    """
+    versions = ([None] if stable else []) + ([version] if version else [])
+    for size_name in sizes:
+        for image_format in IMAGE_FORMATS:
+            for file_version in versions:
+                path = root / variant_filename(name, size_name, image_format, file_version)
+                if await aiofiles.os.path.islink(path) or await aiofiles.os.path.exists(path):
+                    await aiofiles.os.remove(path)
+
+
+def variant_urls(folder: str, name: str, version: Optional[str], sizes: dict) -> Optional[dict[str, str]]:
+    """
+    Versioned URLs of all sizes, None if there is no image
+    """
+    if not version:
+        return None
+    return {
+        size_name: f"{MEDIA_URL}{folder}/{quote(variant_filename(name, size_name, 'png', version))}"
+        for size_name in sizes
+    }
+
+
+async def read_upload(upload: UploadFile, max_size: int) -> bytes:
+    """
+    Read an upload in chunks, rejecting it as soon as it exceeds max_size
+    or its header declares more than MAX_IMAGE_PIXELS.
+    Starlette has already received and spooled the whole multipart body (to a temporary
+    file beyond 1 MB) before the endpoint runs, so this doesn't cut the transfer short:
+    it keeps oversized or huge-dimension images out of memory and out of the decoder.
+    The limit on what is received at all is UploadSizeLimitMiddleware's MAX_UPLOAD_SIZE
+    """
+    if upload.size is not None and upload.size > max_size:
+        raise upload_too_large(max_size)
+
+    buffer = bytearray()
+    dimensions_checked = False
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        buffer.extend(chunk)
+        if len(buffer) > max_size:
+            raise upload_too_large(max_size)
+        if not dimensions_checked:
+            # Image headers are usually within the first chunks, Image.open() reads only the header
+            try:
+                header = Image.open(io.BytesIO(buffer))
+            except (UnidentifiedImageError, OSError, SyntaxError):
+                continue
+            dimensions_checked = True
+            try:
+                check_image_dimensions(header)
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e)) from e
+    return bytes(buffer)
+
+
+async def render_upload(upload: UploadFile, sizes: dict) -> tuple[str, dict[tuple[str, str], bytes]]:
+    """
+    Render an upload in the media process pool, at most MEDIA_MAX_CONCURRENCY at once
+    """
+    async with media_slots:
+        data = await read_upload(upload, settings.MAX_IMAGE_SIZE)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(get_media_pool(), render_variants, data, sizes)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e)) from e
+        except OSError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid image: {e}") from e
+
+
+async def render_stored_thumbnail(path: Path, size: int, image_format: str) -> bytes:
+    """
+    Render a thumbnail of a stored original in the media process pool
+    """
+    async with media_slots:
+        async with aiofiles.open(path, "rb") as file:
+            data = await file.read()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_media_pool(), render_thumbnail, data, size, image_format)
+
+
+async def stored_version(path: Path) -> str:
+    """
+    Version of a stored original: the content hash its stable name points to,
+    the modification time for files stored before content hashing
+    """
+    if await aiofiles.os.path.islink(path):
+        target = await aiofiles.os.readlink(path)
+        return Path(target).stem.rsplit(".", 1)[-1]
+    return str(int(await aiofiles.os.path.getmtime(path)))
+
+
+async def upload_avatar(upload: UploadFile, username: str, old_hash: Optional[str] = None) -> str:
+    """
+    Save avatar with username together with all its size variants
+    Returns the content hash of the new avatar, files of old_hash are removed
+    """
+    version, variants = await render_upload(upload, AVATAR_SIZES)
+    await write_variants(AVATAR_ROOT, username, version, variants)
+    if old_hash and old_hash != version:
+        await delete_variants(AVATAR_ROOT, username, AVATAR_SIZES, old_hash, False)
+    return version
+
+
+async def delete_avatar(username: str, avatar_hash: Optional[str] = None):
     """
     Delete all avatar variants for a user
     """
-    # Delete original
-    original_path = AVATAR_ROOT / f"{username}.png"
-    if original_path.exists():
-        os.remove(original_path)
-    
-    # Delete all size variants
-    for size in AVATAR_SIZES:
-        if size == "original":
-            continue
-        
-        variant_path = AVATAR_ROOT / f"{username}_{size}.png"
-        if variant_path.exists():
-            os.remove(variant_path)
+    await delete_variants(AVATAR_ROOT, username, AVATAR_SIZES, avatar_hash)
+
+
+def avatar_urls(username: str, avatar_hash: Optional[str]) -> Optional[dict[str, str]]:
+    """
+    Immutable URLs of the current avatar sizes
+    """
+    return variant_urls("avatars", username, avatar_hash, AVATAR_SIZES)
 
 
 # Badge management functions
-async def save_badge(upload: UploadFile, badge_id: int) -> str:
-    """
-    Save an uploaded badge image using the badge ID as filename
-    Returns the base filename (without extension)
-    """
-    # Always use PNG format
-    filename = f"badge_{badge_id}.png"
-    
-    # Create full path
-    file_path = BADGE_ROOT / filename
-    
-    # Ensure folder exists
-    BADGE_ROOT.mkdir(exist_ok=True, parents=True)
-    
-    # Save the uploaded file temporarily
-    temp_path = BADGE_ROOT / f"temp_{filename}"
-    with open(temp_path, "wb") as buffer:
-        shutil.copyfileobj(upload.file, buffer)
-    
-    # Convert to PNG and save as original, cropping to square
-    try:
-        img = Image.open(temp_path)
-        
-        # Crop to square
-        width, height = img.size
-        if width != height:
-            # Calculate dimensions for center crop
-            size = min(width, height)
-            left = (width - size) // 2
-            top = (height - size) // 2
-            right = left + size
-            bottom = top + size
-            
-            # Crop the image
-            img = img.crop((left, top, right, bottom))
-        
-        # Save the square image
-        img.save(file_path, "PNG")
-    finally:
-        # Clean up temp file
-        if temp_path.exists():
-            os.remove(temp_path)
-    
+def badge_name(badge_id: int) -> str:
     return f"badge_{badge_id}"
 
-def generate_badge_variants(badge_id: int, sizes: dict = BADGE_SIZES) -> List[Tuple[str, Tuple[int, int]]]:
-    """
-    Generate different sized variants of a badge
-    Returns a list of (filename, size) tuples for created files
-    """
-    generated_files = []
-    original_path = BADGE_ROOT / f"badge_{badge_id}.png"
-    
-    # Check if original file exists
-    if not original_path.exists():
-        return []
-    
-    # Load the original image
-    img = Image.open(original_path)
-    
-    # Process for each size
-    for size_name, dimensions in sizes.items():
-        if dimensions is None:  # Skip resizing for "original"
-            continue
-            
-        # Create a resized copy
-        resized_img = img.copy()
-        resized_img.thumbnail(dimensions, Image.LANCZOS)
-        
-        # Create the variant filename with size suffix
-        variant_filename = f"badge_{badge_id}_{size_name}.png"
-        variant_path = BADGE_ROOT / variant_filename
-        
-        # Save the variant as PNG
-        resized_img.save(variant_path, "PNG")
-        generated_files.append((variant_filename, dimensions))
-    
-    return generated_files
-
-def process_badge_background(badge_id: int):
-    """
-    Process badge in a background task
-    Generates different sizes of badge images
-    """
-    try:
-        # Generate all badge variants
-        generate_badge_variants(badge_id)
-    except Exception as e:
-        # Log error in background task
-        print(f"Error processing badge variants: {e}")
-
-async def upload_badge(upload: UploadFile, badge_id: int, background_tasks: BackgroundTasks) -> str:
-    """
-    Save badge image and schedule background processing for variants
-    Returns the filename
-    """
-    # Save the original file
-    filename = await save_badge(upload, badge_id)
-    
-    # Schedule background processing
-    background_tasks.add_task(process_badge_background, badge_id)
-    
-    return filename
-
-def delete_badge(badge_id: int):
+
+async def upload_badge(upload: UploadFile, badge_id: int, old_hash: Optional[str] = None) -> tuple[str, str]:
+    """
+    Save badge image together with all its size variants
+    Returns the filename and the content hash, files of old_hash are removed
+    """
+    filename = badge_name(badge_id)
+    version, variants = await render_upload(upload, BADGE_SIZES)
+    await write_variants(BADGE_ROOT, filename, version, variants)
+    if old_hash and old_hash != version:
+        await delete_variants(BADGE_ROOT, filename, BADGE_SIZES, old_hash, False)
+    return filename, version
+
+
+async def delete_badge(badge_id: int, image_hash: Optional[str] = None):
     """
     Delete all badge variants for a badge
     """
-    # Delete original
-    original_path = BADGE_ROOT / f"badge_{badge_id}.png"
-    if original_path.exists():
-        os.remove(original_path)
-    
-    # Delete all size variants
-    for size in BADGE_SIZES:
-        if size == "original":
-            continue
-        
-        variant_path = BADGE_ROOT / f"badge_{badge_id}_{size}.png"
-        if variant_path.exists():
-            os.remove(variant_path) 
\ No newline at end of file
+    await delete_variants(BADGE_ROOT, badge_name(badge_id), BADGE_SIZES, image_hash)
+
+
+def badge_urls(badge_id: int, image_hash: Optional[str]) -> Optional[dict[str, str]]:
+    """
+    Immutable URLs of the current badge image sizes
+    """
+    return variant_urls("badges", badge_name(badge_id), image_hash, BADGE_SIZES)
@@ -0,0 +1,46 @@
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Annotated, Optional
+
+from pydantic import BeforeValidator, PlainSerializer
+from sqlalchemy import Numeric
+from sqlalchemy.types import TypeDecorator
+
+# Money is stored exactly, in whole cents
+MONEY_PRECISION = 12
+MONEY_SCALE = 2
+CENT = Decimal("0.01")
+
+
+def to_money(value) -> Optional[Decimal]:
+    """
+    Convert a number to an exact amount of money rounded to cents
+    """
+    if value is None:
+        return None
+    if isinstance(value, float):
+        # str() gives the shortest representation, so 0.1 becomes exactly 0.10
+        value = str(value)
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class MoneyType(TypeDecorator):
+    """
+    NUMERIC(12, 2) column that accepts any number and always returns a Decimal rounded to cents.
+    SQL-side sums and balance updates stay exact
+    """
+    impl = Numeric(MONEY_PRECISION, MONEY_SCALE)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return to_money(value)
+
+    def process_result_value(self, value, dialect):
+        return to_money(value)
+
+
+# Money value in schemas: exact Decimal inside the API, a plain JSON number for clients
+Money = Annotated[
+    Decimal,
+    BeforeValidator(to_money),
+    PlainSerializer(float, return_type=float, when_used="json"),
+]
@@ -0,0 +1,171 @@
+import asyncio
+import contextlib
+import json
+import zlib
+from dataclasses import dataclass
+from datetime import date, datetime, time
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.core.constants import DAILY_TAX_AMOUNT, TransactionTypeEnum
+from app.db.session import SessionLocal
+from app.models.scheduled_run import ScheduledRun
+from app.models.transaction import Transaction
+from app.models.user import User
+
+# Job name of the daily tax, shared with the manual POST /tax
+DAILY_TAX_JOB = "daily_tax"
+
+
+def scheduler_today() -> date:
+    """Current period (day) in SCHEDULER_TIMEZONE"""
+    return datetime.now(ZoneInfo(settings.SCHEDULER_TIMEZONE)).date()
+
+
+@dataclass(frozen=True)
+class RecurringJob:
+    """A transaction paid to all active pioneers once a day at a given time"""
+    name: str
+    transaction_type: TransactionTypeEnum
+    bucks: float
+    at: time
+    description: str = ""
+
+    @property
+    def lock_key(self) -> int:
+        """Key of the Postgres advisory lock that makes one worker the leader of a run"""
+        return zlib.crc32(f"scheduler:{self.name}".encode())
+
+
+def load_jobs() -> list[RecurringJob]:
+    """
+    Jobs from settings: the daily tax and the RECURRING_TRANSACTIONS templates.
+    Invalid entries are logged and skipped
+    """
+    jobs = []
+    if settings.DAILY_TAX_TIME:
+        try:
+            jobs.append(RecurringJob(
+                name=DAILY_TAX_JOB,
+                transaction_type=TransactionTypeEnum.tax,
+                bucks=-DAILY_TAX_AMOUNT,
+                at=time.fromisoformat(settings.DAILY_TAX_TIME),
+            ))
+        except ValueError as e:
+            logger.error(f"Invalid DAILY_TAX_TIME {settings.DAILY_TAX_TIME!r}, daily tax skipped: {e}")
+
+    try:
+        templates = json.loads(settings.RECURRING_TRANSACTIONS)
+        if not isinstance(templates, list):
+            raise ValueError("expected a list of templates")
+    except ValueError as e:
+        logger.error(f"Invalid RECURRING_TRANSACTIONS, recurring transactions skipped: {e}")
+        return jobs
+
+    for template in templates:
+        try:
+            jobs.append(RecurringJob(
+                name=template["name"],
+                transaction_type=TransactionTypeEnum(template["type"]),
+                bucks=float(template["amount"]),
+                at=time.fromisoformat(template["time"]),
+                description=template.get("description", ""),
+            ))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            logger.error(f"Invalid recurring transaction {template!r} skipped: {e}")
+    return jobs
+
+
+def run_job(job: RecurringJob, period: date) -> bool:
+    """
+    Run a job for a period in one DB transaction.
+    Only the worker holding the advisory lock runs it, and the scheduled_runs
+    uniqueness guard makes a period run at most once even across restarts.
+    Returns False if another worker holds the lock and the run should be retried
+    """
+    with SessionLocal() as db:
+        # Transaction-scoped lock, released on commit or rollback
+        if not db.execute(select(func.pg_try_advisory_xact_lock(job.lock_key))).scalar():
+            db.rollback()
+            return False
+
+        run_id = ScheduledRun.claim(db, job.name, period)
+        if run_id is None:
+            db.rollback()
+            return True
+
+        creator = db.query(User).filter(User.username == settings.SCHEDULER_CREATOR_USERNAME).first()
+        if creator is None:
+            db.rollback()
+            logger.error(f"Scheduler user {settings.SCHEDULER_CREATOR_USERNAME} not found, {job.name} skipped")
+            return True
+
+        transaction, recipients_count = Transaction.new_pioneer_transaction(
+            creator=creator,
+            transaction_type=job.transaction_type,
+            bucks=job.bucks,
+            description=job.description,
+            db=db,
+        )
+        if not recipients_count:
+            # Keep the claim so the empty period isn't retried
+            db.delete(transaction)
+            db.commit()
+            logger.warning(f"No active users found for scheduled {job.name}")
+            return True
+
+        # Process commits the transaction together with its recipients and the run
+        ScheduledRun.set_transaction(db, run_id, transaction.id)
+        transaction.process(db)
+        logger.info(f"Scheduled {job.name} for {period} applied to {recipients_count} users")
+        return True
+
+
+class Scheduler:
+    """
+    In-process scheduler of recurring jobs. Every worker runs one, the DB guards
+    make sure each job runs once per day however many workers there are
+    """
+
+    def __init__(self, interval_seconds: int):
+        self.interval_seconds = interval_seconds
+        self.jobs: list[RecurringJob] = []
+        self._done: dict[str, date] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        # Parsed only when the scheduler is started, bad settings can't break the import
+        self.jobs = load_jobs()
+        if self.jobs:
+            logger.info(f"Starting scheduler with jobs: {', '.join(job.name for job in self.jobs)}")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self):
+        tz = ZoneInfo(settings.SCHEDULER_TIMEZONE)
+        while True:
+            now = datetime.now(tz)
+            for job in self.jobs:
+                # A job missed while the app was down runs as soon as it is up again
+                if now.time() < job.at or self._done.get(job.name) == now.date():
+                    continue
+                try:
+                    if await run_in_threadpool(run_job, job, now.date()):
+                        self._done[job.name] = now.date()
+                except Exception as e:
+                    logger.error(f"Scheduled {job.name} failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+
+scheduler = Scheduler(settings.SCHEDULER_INTERVAL_SECONDS)
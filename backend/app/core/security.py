@@ -1,13 +1,73 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Union
+from typing import Any, Optional, Union
 
 from jose import jwt
 from passlib.context import CryptContext
 
 from app.core.config import settings
 
-# Password context for hashing and verifying
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password context for hashing and verifying.
+# Hashes with other rounds than BCRYPT_ROUNDS need an update and are rehashed on login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+
+class PasswordHashQueueFull(RuntimeError):
+    """Raised when too many password hashing jobs are waiting"""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a dedicated bounded thread pool so that a login rush can use
+    at most PASSWORD_HASH_WORKERS cores. bcrypt releases the GIL while hashing
+    """
+
+    def __init__(self, workers: int, max_queue: int, queue_timeout: float):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs submitted and not finished yet"""
+        return self._pending
+
+    def submit(self, fn, *args, wait: bool = True) -> Future:
+        """
+        Queue a hashing job. Waits up to queue_timeout for a free slot,
+        callers on the event loop pass wait=False and are rejected right away
+        """
+        acquired = self._slots.acquire(timeout=self.queue_timeout) if wait else self._slots.acquire(blocking=False)
+        if not acquired:
+            raise PasswordHashQueueFull("Too many password hashing requests")
+        with self._lock:
+            self._pending += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+
+password_hasher = PasswordHasher(
+    settings.PASSWORD_HASH_WORKERS,
+    settings.PASSWORD_HASH_MAX_QUEUE,
+    settings.PASSWORD_HASH_QUEUE_TIMEOUT,
+)
 
 # JWT algorithm
 ALGORITHM = "HS256"
@@ -37,10 +97,27 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verify a password against a hash
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.submit(pwd_context.verify, plain_password, hashed_password).result()
 
 def get_password_hash(password: str) -> str:
     """
     Hash a password
     """
-    return pwd_context.hash(password) 
\ No newline at end of file
+    return password_hasher.submit(pwd_context.hash, password).result()
+
+
+async def get_password_hash_async(password: str) -> str:
+    """
+    Hash a password without blocking the event loop
+    """
+    return await asyncio.wrap_future(password_hasher.submit(pwd_context.hash, password, wait=False))
+
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """
+    Verify a password without blocking the event loop.
+    Returns a new hash if the stored one was made with other bcrypt rounds
+    """
+    return await asyncio.wrap_future(
+        password_hasher.submit(pwd_context.verify_and_update, plain_password, hashed_password, wait=False)
+    )
@@ -0,0 +1,130 @@
+from collections.abc import Iterable
+from decimal import Decimal
+from typing import Optional
+
+from app.core.config import settings
+from app.core.money import to_money
+from app.models.statistics_aggregate import (
+    SCOPE_BALANCE,
+    SCOPE_COUNTER,
+    SCOPE_PARTY,
+    SCOPE_TOTAL,
+    SCOPE_TYPE,
+)
+
+# Percentiles of the pioneer balances in the snapshot
+BALANCE_PERCENTILES = (10, 25, 75, 90)
+
+
+def average(total, count: int) -> Decimal:
+    """Average amount of money rounded to cents, zero for nobody"""
+    return to_money(total / count) if count else to_money(0)
+
+
+def balance_distribution(buckets: dict[int, int]) -> dict:
+    """
+    Median, percentiles and histogram of the balances from the pioneer counts of their
+    STATISTICS_BALANCE_BUCKET wide buckets. Percentiles are interpolated inside a bucket,
+    so they are exact up to the bucket width
+    """
+    width = settings.STATISTICS_BALANCE_BUCKET
+    histogram = [(bucket, count) for bucket, count in sorted(buckets.items()) if count > 0]
+    total = sum(count for _, count in histogram)
+    if not total:
+        return {
+            "median_balance": to_money(0),
+            "percentiles": {str(p): to_money(0) for p in BALANCE_PERCENTILES},
+            "histogram": [],
+        }
+
+    def percentile(p) -> Decimal:
+        rank = Decimal(total * p) / 100
+        seen = 0
+        for bucket, count in histogram:
+            if seen + count >= rank:
+                return to_money(bucket * width + width * (rank - seen) / count)
+            seen += count
+        return to_money((histogram[-1][0] + 1) * width)
+
+    return {
+        "median_balance": percentile(50),
+        "percentiles": {str(p): percentile(p) for p in BALANCE_PERCENTILES},
+        "histogram": [
+            {"min": to_money(bucket * width), "max": to_money((bucket + 1) * width), "count": count}
+            for bucket, count in histogram
+        ],
+    }
+
+
+def build_snapshot(aggregates: Iterable[tuple[str, str, int, Decimal, int]]) -> dict:
+    """
+    Statistics snapshot from the running aggregates, with the version stamp they were
+    read at (see StatisticsAggregate.all_query)
+    """
+    snapshot = {
+        "version": 0,
+        "student_count": 0,
+        "total_balance": to_money(0),
+        "avg_balance": to_money(0),
+        "parties": {},
+        "flows": {},
+        "counters": {},
+    }
+    buckets = {}
+    for scope, key, shards_count, amount, version in aggregates:
+        snapshot["version"] = int(version)
+        count = int(shards_count)
+        if scope == SCOPE_TOTAL:
+            snapshot["student_count"] = count
+            snapshot["total_balance"] = amount
+            snapshot["avg_balance"] = average(amount, count)
+        elif scope == SCOPE_PARTY:
+            snapshot["parties"][key] = {
+                "student_count": count,
+                "total_balance": amount,
+                "avg_balance": average(amount, count),
+            }
+        elif scope == SCOPE_TYPE:
+            snapshot["flows"][key] = {"transactions": count, "amount": amount}
+        elif scope == SCOPE_COUNTER:
+            snapshot["counters"][key] = count
+        elif scope == SCOPE_BALANCE:
+            buckets[int(key)] = count
+
+    snapshot.update(balance_distribution(buckets))
+    return snapshot
+
+
+class StatisticsCache:
+    """
+    The last snapshot of this process. Valid while the version stamp in the DB is unchanged,
+    so a read is one small query unless something changed since, and then a read of the aggregates
+    """
+
+    def __init__(self):
+        # (version, snapshot), replaced with one assignment so readers never see a mixed pair
+        self._entry: Optional[tuple[int, dict]] = None
+
+    def get(self, version: int) -> Optional[dict]:
+        entry = self._entry
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        return None
+
+    def put(self, snapshot: dict) -> dict:
+        # Keyed by the version read with the aggregates, a concurrent change just causes one more rebuild
+        self._entry = (snapshot["version"], snapshot)
+        return snapshot
+
+
+statistics_cache = StatisticsCache()
+
+
+def format_statistics(snapshot: dict) -> dict[str, Decimal]:
+    """
+    The original average and total balance response
+    """
+    return {
+        "avg_balance": snapshot["avg_balance"],
+        "total_balance": snapshot["total_balance"],
+    }
@@ -0,0 +1,102 @@
+import asyncio
+import os
+from collections import OrderedDict
+from collections.abc import Awaitable
+from pathlib import Path
+from typing import Callable
+
+import aiofiles.os
+from loguru import logger
+
+from app.core.config import settings
+from app.core.media import THUMBNAIL_ROOT, write_file
+
+# Sizes the thumbnail endpoint renders, anything else is rejected.
+# Formats are the ones of media.output_formats()
+THUMBNAIL_SIZES = {24, 32, 48, 64, 96, 128, 192, 256, 384, 512}
+
+
+class ThumbnailCache:
+    """
+    Size-bounded LRU cache of rendered thumbnails on disk.
+    Concurrent requests for a missing thumbnail share one render (single-flight).
+    Only used from the event loop, so it needs no locks.
+    The index is per process: workers sharing the directory each keep their own,
+    so together they can use up to max_bytes each, and a file may be evicted by
+    another worker, which is why hits check that it still exists
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._rendering: dict[str, asyncio.Future] = {}
+        self._load()
+
+    def _load(self):
+        """
+        Index thumbnails left from previous runs, least recently used first
+        """
+        self.root.mkdir(exist_ok=True, parents=True)
+        files = sorted(
+            (entry for entry in os.scandir(self.root) if entry.is_file()),
+            key=lambda entry: entry.stat().st_atime,
+        )
+        for entry in files:
+            size = entry.stat().st_size
+            self._entries[entry.name] = size
+            self.total_bytes += size
+
+    async def get(self, key: str, render: Callable[[], Awaitable[bytes]]) -> Path:
+        """
+        Get the path of a cached thumbnail, rendering it on a miss
+        """
+        if key in self._entries:
+            if await aiofiles.os.path.exists(self.root / key):
+                self._entries.move_to_end(key)
+                return self.root / key
+            # Removed behind our back (another worker's eviction, a cleanup), render it again
+            self.total_bytes -= self._entries.pop(key, 0)
+
+        pending = self._rendering.get(key)
+        if pending is not None:
+            await pending
+            return self.root / key
+
+        future = asyncio.get_running_loop().create_future()
+        self._rendering[key] = future
+        try:
+            data = await render()
+            await write_file(self.root / key, data)
+            self._entries[key] = len(data)
+            self.total_bytes += len(data)
+            await self._evict()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(None)
+        finally:
+            del self._rendering[key]
+        return self.root / key
+
+    async def _evict(self):
+        """
+        Delete least recently used thumbnails until the cache fits in max_bytes
+        """
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                await aiofiles.os.remove(self.root / key)
+            except FileNotFoundError:
+                logger.warning(f"Thumbnail {key} was already removed from the cache")
+
+
+thumbnail_cache = ThumbnailCache(THUMBNAIL_ROOT, settings.THUMBNAIL_CACHE_MAX_BYTES)
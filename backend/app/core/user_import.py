@@ -0,0 +1,161 @@
+import csv
+from collections.abc import Iterable
+from typing import Optional
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from transliterate import translit
+
+from app.core.security import get_password_hash
+from app.models.statistics_aggregate import StatisticsAggregate
+from app.models.user import User
+from app.schemas.user import UserCSVImport
+
+# Password of every imported user
+DEFAULT_PASSWORD = "r"
+# Users inserted per INSERT statement
+IMPORT_BATCH_SIZE = 500
+
+TRUE_VALUES = ("true", "1", "yes")
+
+
+def load_usernames(db: Session) -> set[str]:
+    """
+    Load all taken usernames in one query
+    """
+    return set(db.execute(select(User.username)).scalars())
+
+
+def generate_username(
+    last_name: str, first_name: str, middle_name: Optional[str], taken: set[str]
+) -> str:
+    """
+    Generate a free username from name parts, checking it against the taken set
+    """
+    # приведение к нижнему регистру
+    base = translit(last_name.strip().lower(), "ru", reversed=True).replace("'", "")
+    first_initial = translit(first_name.strip().lower()[0], "ru", reversed=True).replace("'", "")
+    middle_initial = translit(middle_name.strip().lower()[0] if middle_name else "", "ru", reversed=True).replace("'", "")
+
+    # этапы расширения
+    stages = [base, f"{base}.{first_initial}", f"{base}.{first_initial}.{middle_initial}"]
+    for stage in stages:
+        if stage not in taken:
+            return stage
+
+    # если все занято, начинаем счет
+    counter = 1
+    while f"{stages[-1]}{counter}" in taken:
+        counter += 1
+    return f"{stages[-1]}{counter}"
+
+
+class PasswordHashes:
+    """
+    Hashes every distinct password once per import, bcrypt is by far the slowest part of it
+    """
+
+    def __init__(self):
+        self._hashes: dict[str, str] = {}
+
+    def get(self, password: str) -> str:
+        if password not in self._hashes:
+            self._hashes[password] = get_password_hash(password)
+        return self._hashes[password]
+
+
+def parse_csv_row(row: dict[str, str]) -> UserCSVImport:
+    """
+    Parse a CSV row into import data
+    """
+    def text(name: str) -> Optional[str]:
+        value = (row.get(name) or "").strip()
+        return value or None
+
+    return UserCSVImport(
+        username=text("username"),
+        last_name=row["last_name"].strip(),
+        first_name=row["first_name"].strip(),
+        middle_name=text("middle_name"),
+        party=int(row["party"]) if row.get("party") else 0,
+        grade=int(row["grade"]) if row.get("grade") else 0,
+        is_staff=(row.get("is_staff") or "false").lower() in TRUE_VALUES,
+        is_superuser=(row.get("is_superuser") or "false").lower() in TRUE_VALUES,
+        bio=text("bio"),
+        position=text("position"),
+    )
+
+
+def user_row(user_data: UserCSVImport, hashed_password: str) -> dict:
+    """
+    Column values of a new user for a bulk INSERT
+    """
+    return {
+        "username": user_data.username,
+        "hashed_password": hashed_password,
+        "first_name": user_data.first_name,
+        "last_name": user_data.last_name,
+        "middle_name": user_data.middle_name,
+        "party": user_data.party,
+        "grade": user_data.grade,
+        "is_staff": user_data.is_staff,
+        "is_superuser": user_data.is_superuser,
+        "bio": user_data.bio,
+        "position": user_data.position,
+    }
+
+
+def insert_users(db: Session, rows: list[dict]):
+    """
+    Insert new users in batches of IMPORT_BATCH_SIZE and count them in the statistics
+    """
+    for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+        db.execute(insert(User), rows[start:start + IMPORT_BATCH_SIZE])
+    StatisticsAggregate.add_new_users(db, rows)
+
+
+def import_users_csv(db: Session, lines: Iterable[str], dry_run: bool = False) -> dict:
+    """
+    Import users from CSV lines.
+    Usernames are checked and generated against a set loaded once, so there are
+    no queries per row. With dry_run nothing is written and only the report is returned
+    """
+    taken = load_usernames(db)
+    hashes = PasswordHashes()
+    rows = []
+    errors = []
+    total_rows = 0
+
+    # Start from 2 because row 1 is header
+    for row_num, row in enumerate(csv.DictReader(lines), start=2):
+        total_rows += 1
+        try:
+            user_data = parse_csv_row(row)
+
+            # Generate username if not provided
+            if not user_data.username:
+                user_data.username = generate_username(
+                    user_data.last_name, user_data.first_name, user_data.middle_name, taken
+                )
+            elif user_data.username in taken:
+                errors.append(f"Row {row_num}: Username '{user_data.username}' already exists")
+                continue
+
+            taken.add(user_data.username)
+            rows.append(user_row(user_data, None if dry_run else hashes.get(DEFAULT_PASSWORD)))
+        except Exception as e:
+            errors.append(f"Row {row_num}: {e}")
+
+    if not dry_run:
+        insert_users(db, rows)
+        db.commit()
+
+    imported_users = [row["username"] for row in rows]
+    verb = "Would import" if dry_run else "Successfully imported"
+    return {
+        "message": f"{verb} {len(imported_users)} users",
+        "imported_users": imported_users,
+        "errors": errors,
+        "total_rows_processed": total_rows,
+        "dry_run": dry_run,
+    }
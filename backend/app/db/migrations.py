@@ -0,0 +1,71 @@
+from loguru import logger
+from sqlalchemy import Float, inspect, text
+
+from app.core.money import MONEY_PRECISION, MONEY_SCALE
+from app.db.session import Base
+
+# Money columns that were Float before money became exact NUMERIC
+MONEY_COLUMNS = {
+    "users": ["balance", "certificates"],
+    "transaction_recipients": ["bucks", "certs"],
+}
+
+
+# Columns added to existing tables after the tables were created
+ADDED_COLUMNS = {
+    "users": ["avatar_hash"],
+    "badges": ["image_hash"],
+}
+
+
+def ensure_columns(bind):
+    """
+    Add columns declared on the models that are missing in an existing database
+    """
+    with bind.begin() as connection:
+        for table_name, columns in ADDED_COLUMNS.items():
+            table = Base.metadata.tables[table_name]
+            for column in columns:
+                column_type = table.c[column].type.compile(dialect=bind.dialect)
+                connection.execute(text(
+                    f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {column} {column_type}"
+                ))
+
+
+def ensure_indexes(bind):
+    """
+    Create indexes declared on the models that are missing in an existing database.
+    create_all() only creates indexes together with new tables
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+
+def migrate_money_columns(bind):
+    """
+    Convert Float money columns of an existing database to NUMERIC, rounding stored values to cents
+    """
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table, columns in MONEY_COLUMNS.items():
+            column_types = {column["name"]: column["type"] for column in inspector.get_columns(table)}
+            for column in columns:
+                if not isinstance(column_types.get(column), Float):
+                    continue
+                logger.info(f"Converting {table}.{column} to NUMERIC({MONEY_PRECISION}, {MONEY_SCALE})")
+                connection.execute(text(
+                    f"ALTER TABLE {table} ALTER COLUMN {column} "
+                    f"TYPE NUMERIC({MONEY_PRECISION}, {MONEY_SCALE}) "
+                    f"USING ROUND({column}::numeric, {MONEY_SCALE})"
+                ))
+
+
+def run_migrations(bind):
+    """
+    Bring an existing database up to date with the models
+    """
+    logger.info("Running database migrations")
+    migrate_money_columns(bind)
+    ensure_columns(bind)
+    ensure_indexes(bind)
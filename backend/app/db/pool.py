@@ -0,0 +1,133 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from app.core.config import settings
+
+
+class PoolMetrics:
+    """Checkout wait time, timeout and overflow counters of a connection pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.overflow_checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_checkout(self, wait: float, overflow: bool):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if overflow:
+                self.overflow_checkouts += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self, pool) -> dict:
+        """Get the counters together with the current state of the pool"""
+        with self._lock:
+            result = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "overflow_checkouts": self.overflow_checkouts,
+                "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+        if isinstance(pool, QueuePool):
+            result.update(
+                size=pool.size(),
+                in_use=pool.checkedout(),
+                idle=pool.checkedin(),
+                overflow=max(0, pool.overflow()),
+            )
+        return result
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that measures how long each checkout waits for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_checkout(time.perf_counter() - start, self.overflow() > 0)
+        return connection
+
+    @property
+    def metrics(self) -> PoolMetrics:
+        # Pools are recreated on dispose(), metrics live on the class for the engine's lifetime
+        return type(self).pool_metrics
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """Instrumented pool for async engines"""
+
+
+def instrumented_pool_class(base) -> type:
+    """Get an instrumented pool class with its own metrics"""
+    return type(base.__name__, (base,), {"pool_metrics": PoolMetrics()})
+
+
+def engine_options(is_async: bool = False) -> dict:
+    """
+    Engine keyword arguments from settings.
+    In PgBouncer mode connections are not pooled by SQLAlchemy and no server-side
+    prepared statements or startup parameters are used
+    """
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    connect_args = {}
+
+    if settings.DB_PGBOUNCER_MODE:
+        options["poolclass"] = NullPool
+        if is_async:
+            # asyncpg prepares statements server-side, which breaks with transaction pooling
+            connect_args.update(statement_cache_size=0, prepared_statement_cache_size=0)
+    else:
+        options.update(
+            poolclass=instrumented_pool_class(InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool),
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+        if settings.DB_STATEMENT_TIMEOUT_MS:
+            if is_async:
+                connect_args["server_settings"] = {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}
+            else:
+                connect_args["options"] = f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"
+
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
+
+
+def configure_engine(engine):
+    """
+    Per-transaction settings that can't be passed as startup parameters through PgBouncer
+    """
+    if settings.DB_PGBOUNCER_MODE and settings.DB_STATEMENT_TIMEOUT_MS:
+        @event.listens_for(getattr(engine, "sync_engine", engine), "begin")
+        def set_statement_timeout(connection):
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(settings.DB_STATEMENT_TIMEOUT_MS)}")
+
+
+def pool_metrics(engine) -> dict:
+    """
+    Get pool metrics of an engine
+    """
+    pool = engine.pool
+    metrics = getattr(type(pool), "pool_metrics", None)
+    if metrics is None:
+        return {"pool": type(pool).__name__}
+    return {"pool": type(pool).__name__, **metrics.snapshot(pool)}
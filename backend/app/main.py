@@ -1,14 +1,20 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from loguru import logger
 
 from app.api.v1 import router as api_router
 from app.core.config import settings
 from app.core.logging import configure_logging
-from app.core.security import get_password_hash
-from app.db.session import SessionLocal
+from app.core.media import shutdown_media_pool
+from app.core.scheduler import scheduler
+from app.core.security import PasswordHashQueueFull, get_password_hash, password_hasher
+from app.core.upload_limit import UploadSizeLimitMiddleware
+from app.db.migrations import run_migrations
+from app.db.pool import pool_metrics
+from app.db.session import Base, SessionLocal, async_engine, engine
+from app.models.statistics_aggregate import StatisticsAggregate
 from app.models.user import User
-from app.db.session import Base, engine
 
 # Configure loguru
 configure_logging()
@@ -19,6 +25,9 @@ app = FastAPI(
     version="0.1.0"
 )
 
+# Reject request bodies larger than MAX_UPLOAD_SIZE while they stream in
+app.add_middleware(UploadSizeLimitMiddleware, max_size=settings.MAX_UPLOAD_SIZE)
+
 # Setup CORS
 app.add_middleware(
     CORSMiddleware,
@@ -26,11 +35,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Set maximum upload file size to 10MB
-app.max_upload_size = 100 * 1024 * 1024  # 100 MB
-
 @app.get("/")
 async def root():
     return {"message": "Welcome to LFMSH Bank API"}
@@ -39,6 +46,33 @@ async def root():
 async def health_check():
     return {"status": "ok"}
 
+
+@app.get("/health/db-pool")
+async def db_pool_metrics():
+    metrics = {"sync": pool_metrics(engine)}
+    if async_engine is not None:
+        metrics["async"] = pool_metrics(async_engine.sync_engine)
+    return metrics
+
+
+@app.get("/health/password-hash")
+async def password_hash_metrics():
+    return {
+        "workers": password_hasher.workers,
+        "queue_depth": password_hasher.queue_depth,
+        "bcrypt_rounds": settings.BCRYPT_ROUNDS,
+    }
+
+
+@app.exception_handler(PasswordHashQueueFull)
+async def password_hash_queue_full_handler(request: Request, exc: PasswordHashQueueFull):
+    logger.warning(f"Password hashing queue is full, rejecting {request.url.path}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, try again later"},
+        headers={"Retry-After": "1"},
+    )
+
 def create_test_users(db):
     if not settings.TEST_MODE:
         return
@@ -76,6 +110,7 @@ def create_test_users(db):
         )
         
         db.add(new_user)
+        StatisticsAggregate.move_user(db, new_user, None)
         logger.info(f"Created test user: {user_data['username']} ({user_data['first_name']} {user_data['last_name']})")
     
     try:
@@ -91,14 +126,40 @@ def initialize_data():
     logger.info("=== APPLICATION STARTUP - INITIALIZING DATABASE ===")
     db = SessionLocal()
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
     try:
         # Create test users if TEST_MODE is enabled
         create_test_users(db)
         logger.info("=== DATABASE INITIALIZATION COMPLETED SUCCESSFULLY ===")
     except Exception as e:
+        db.rollback()
         logger.error(f"=== DATABASE INITIALIZATION FAILED: {str(e)} ===")
+
+    try:
+        # Count the running statistics from scratch on the first start.
+        # Without them every statistics read would be wrong, so a failure stops the startup
+        StatisticsAggregate.populate(db)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.critical(f"=== STATISTICS POPULATION FAILED: {e} ===")
+        raise
     finally:
         db.close()
 
+
+@app.on_event("startup")
+async def start_scheduler():
+    if settings.SCHEDULER_ENABLED:
+        scheduler.start()
+
+
+@app.on_event("shutdown")
+async def dispose_engines():
+    await scheduler.stop()
+    shutdown_media_pool()
+    if async_engine is not None:
+        await async_engine.dispose()
+
 # Include API routers
 app.include_router(api_router, prefix=settings.API_V1_STR) 
\ No newline at end of file
@@ -1,5 +1,8 @@
 from app.db.session import Base
-from app.models.user import User
-from app.models.transaction import Transaction
 from app.models.atomic_transaction import AtomicTransaction, AtomicTransactionType
-from app.models.badge import Badge 
\ No newline at end of file
+from app.models.badge import Badge
+from app.models.idempotency_key import IdempotencyKey
+from app.models.scheduled_run import ScheduledRun
+from app.models.statistics_aggregate import StatisticsAggregate
+from app.models.transaction import Transaction
+from app.models.user import User
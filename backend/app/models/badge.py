@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, String, Integer, Text
+from sqlalchemy import Boolean, Column, Integer, String, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -12,6 +12,7 @@ class Badge(Base):
     name = Column(String(256), unique=True, index=True, nullable=False)
     description = Column(Text, nullable=True)
     image_filename = Column(String(256), nullable=True)  # Filename of uploaded image
+    image_hash = Column(String(32), nullable=True)  # Content hash of the current image
     
     # Optional settings
     is_active = Column(Boolean, default=True)
@@ -19,11 +20,18 @@ class Badge(Base):
     def __str__(self):
         return self.name
     
+    @property
+    def image_urls(self):
+        """Versioned URLs of the image sizes"""
+        from app.core.media import badge_urls
+        return badge_urls(self.id, self.image_hash)
+
     def full_info_as_dict(self):
         return {
             'id': self.id,
             'name': self.name,
             'description': self.description,
             'image_filename': self.image_filename,
+            'image_urls': self.image_urls,
             'is_active': self.is_active
         } 
\ No newline at end of file
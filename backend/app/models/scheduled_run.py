@@ -0,0 +1,52 @@
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import (
+    Column,
+    Date,
+    DateTime,
+    ForeignKey,
+    Integer,
+    String,
+    UniqueConstraint,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from app.db.session import Base
+
+
+class ScheduledRun(Base):
+    """A run of a recurring job for one period, at most one per job and period"""
+    __tablename__ = "scheduled_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job = Column(String(255), nullable=False)
+    period = Column(Date, nullable=False)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("job", "period", name="uq_scheduled_runs_job_period"),
+    )
+
+    @classmethod
+    def claim(cls, db: Session, job: str, period: date) -> Optional[int]:
+        """
+        Claim the run of job for period inside the current DB transaction.
+        Returns the run id, None if the period was already claimed.
+        A rollback of the job releases the claim
+        """
+        return db.execute(
+            insert(cls)
+            .values(job=job, period=period)
+            .on_conflict_do_nothing(constraint="uq_scheduled_runs_job_period")
+            .returning(cls.id)
+        ).scalar()
+
+    @classmethod
+    def set_transaction(cls, db: Session, run_id: int, transaction_id: int):
+        """Record the transaction created by a run"""
+        db.execute(update(cls).where(cls.id == run_id).values(transaction_id=transaction_id))
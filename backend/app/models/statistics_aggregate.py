@@ -0,0 +1,241 @@
+import math
+from collections.abc import Sequence
+from typing import Optional
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    SmallInteger,
+    String,
+    and_,
+    delete,
+    func,
+    select,
+    text,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.money import MoneyType, to_money
+from app.db.session import Base
+
+# Scopes of the running aggregates:
+# meta/populated - present once the aggregates were computed from scratch, see populate
+# total/""       - count of pioneers and sum of their balances
+# party/<party>  - the same per party
+# counter/<name> - attendance totals of pioneers (lab, lec, sem, fac) in count
+# type/<type>    - processed transactions of a type in count and their money flow in amount
+# balance/<n>    - pioneers with a balance in [n, n + 1) * STATISTICS_BALANCE_BUCKET in count
+SCOPE_META = "meta"
+SCOPE_TOTAL = "total"
+SCOPE_PARTY = "party"
+SCOPE_COUNTER = "counter"
+SCOPE_TYPE = "type"
+SCOPE_BALANCE = "balance"
+
+POPULATED_KEY = "populated"
+
+ATTENDANCE_COUNTERS = ("lab", "lec", "sem", "fac")
+
+# Upserts run on PostgreSQL, and on SQLite in the tests
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def pioneer_condition():
+    """Active users that are neither staff nor superusers"""
+    from app.models.user import User
+
+    return and_(User.is_active == True, User.is_staff == False, User.is_superuser == False)
+
+
+def balance_bucket(balance) -> int:
+    """Number of the histogram bucket a balance falls into"""
+    return math.floor(to_money(balance) / settings.STATISTICS_BALANCE_BUCKET)
+
+
+def statistics_party(user) -> Optional[str]:
+    """Party key a user is counted in, None for users outside the pioneer statistics"""
+    if user.is_active and not user.is_staff and not user.is_superuser:
+        return str(user.party)
+    return None
+
+
+class StatisticsDelta:
+    """Changes of the aggregates, collected and then written with one upsert"""
+
+    def __init__(self):
+        self._changes: dict[tuple[str, str], list] = {}
+
+    def add(self, scope: str, key="", count=0, amount=0):
+        change = self._changes.setdefault((scope, str(key)), [0, 0])
+        change[0] += count
+        change[1] += amount
+
+    def add_pioneers(self, party: str, count=0, balance=0, counters: Sequence[int] = ()):
+        """Pioneers (count) with their balance and attendance joining (or with negatives leaving) a party"""
+        self.add(SCOPE_TOTAL, count=count, amount=balance)
+        self.add(SCOPE_PARTY, party, count=count, amount=balance)
+        for name, value in zip(ATTENDANCE_COUNTERS, counters):
+            self.add(SCOPE_COUNTER, name, count=value)
+
+    def add_balances(self, balance, count=1):
+        """Pioneers (count) with a balance joining (or with a negative count leaving) its histogram bucket"""
+        self.add(SCOPE_BALANCE, balance_bucket(balance), count=count)
+
+    def move_balance(self, old_balance, new_balance):
+        """A pioneer's balance changing, which may move them to another histogram bucket"""
+        if balance_bucket(old_balance) != balance_bucket(new_balance):
+            self.add_balances(old_balance, -1)
+            self.add_balances(new_balance, 1)
+
+    def rows(self, shard: int) -> list[dict]:
+        # Sorted, so concurrent writers to a shard lock its rows in the same order
+        return [
+            {"scope": scope, "key": key, "shard": shard, "count": count, "amount": amount, "version": 1}
+            for (scope, key), (count, amount) in sorted(self._changes.items())
+        ]
+
+
+class StatisticsAggregate(Base):
+    """
+    A running aggregate of the statistics, updated together with the data it summarizes.
+    Every aggregate is split into STATISTICS_SHARDS rows, so concurrent transactions
+    rarely wait for each other's row locks; readers sum the shards
+    """
+    __tablename__ = "statistics_aggregates"
+
+    scope = Column(String(32), primary_key=True)
+    key = Column(String(64), primary_key=True)
+    shard = Column(SmallInteger, primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+    amount = Column(MoneyType, nullable=False, default=0)
+    # Bumped by every write. Rows are only deleted by a recount, which keeps the sum
+    # growing, so the sum changes whenever a committed change becomes visible
+    version = Column(BigInteger, nullable=False, default=0)
+
+    @classmethod
+    def add(cls, db: Session, delta: StatisticsDelta, shard_by: int):
+        """
+        Add a delta to the aggregates in the current DB transaction, into the shard of shard_by
+        """
+        rows = delta.rows(shard_by % settings.STATISTICS_SHARDS)
+        if not rows:
+            return
+        statement = UPSERT_INSERTS[db.get_bind().dialect.name](cls).values(rows)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[cls.scope, cls.key, cls.shard],
+            set_={
+                "count": cls.count + statement.excluded.count,
+                "amount": cls.amount + statement.excluded.amount,
+                "version": cls.version + 1,
+            },
+        ))
+
+    @classmethod
+    def move_user(cls, db: Session, user, old_party: Optional[str]):
+        """
+        Move a user between the pioneer aggregates after a change of party or status.
+        old_party is statistics_party() before the change, None for a new user
+        """
+        from app.models.user import User
+
+        # Defaults of new users and the changes are only set on flush
+        db.flush()
+        new_party = statistics_party(user)
+        if new_party == old_party:
+            return
+
+        # The flushed UPDATE holds the row lock, so the balance can't change under us
+        balance, *counters = db.execute(
+            select(User.balance, *(getattr(User, f"{name}_count") for name in ATTENDANCE_COUNTERS))
+            .where(User.id == user.id)
+        ).one()
+        balance = balance or 0
+        counters = [value or 0 for value in counters]
+        delta = StatisticsDelta()
+        if old_party is not None:
+            delta.add_pioneers(old_party, -1, -balance, [-value for value in counters])
+            delta.add_balances(balance, -1)
+        if new_party is not None:
+            delta.add_pioneers(new_party, 1, balance, counters)
+            delta.add_balances(balance)
+        cls.add(db, delta, user.id)
+
+    @classmethod
+    def add_new_users(cls, db: Session, rows: list[dict]):
+        """
+        Count users inserted in bulk with zero balance and attendance
+        """
+        delta = StatisticsDelta()
+        for row in rows:
+            if row.get("is_active", True) and not row.get("is_staff") and not row.get("is_superuser"):
+                delta.add_pioneers(str(row.get("party", 0)), 1)
+                delta.add_balances(0)
+        cls.add(db, delta, 0)
+
+    @classmethod
+    def populate(cls, db: Session, force=False):
+        """
+        Compute the aggregates from scratch unless that was done already, or always with force.
+        On PostgreSQL the table lock blocks writers (not readers) until the counts are committed,
+        and workers starting together wait for the first one and then skip. SQLite allows a
+        single writer anyway
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(text(f"LOCK TABLE {cls.__tablename__} IN EXCLUSIVE MODE"))
+        if not force and db.get(cls, (SCOPE_META, POPULATED_KEY, 0)) is not None:
+            return
+
+        # Deltas committed before are part of the recount, the version must still grow
+        old_version = db.execute(cls.version_query()).scalar()
+        db.execute(delete(cls))
+        cls.add(db, cls._recount(db), 0)
+        db.add(cls(scope=SCOPE_META, key=POPULATED_KEY, shard=0, count=1, amount=0, version=old_version + 1))
+
+    @staticmethod
+    def _recount(db: Session) -> StatisticsDelta:
+        from app.models.transaction import Transaction, TransactionRecipient
+        from app.models.user import User
+
+        delta = StatisticsDelta()
+        counter_columns = (func.coalesce(func.sum(getattr(User, f"{name}_count")), 0) for name in ATTENDANCE_COUNTERS)
+        for party, count, balance, *counters in db.execute(
+            select(User.party, func.count(User.id), func.coalesce(func.sum(User.balance), 0), *counter_columns)
+            .where(pioneer_condition())
+            .group_by(User.party)
+        ):
+            delta.add_pioneers(str(party), count, balance, counters)
+        for name in ATTENDANCE_COUNTERS:
+            delta.add(SCOPE_COUNTER, name)
+        for balance in db.execute(select(User.balance).where(pioneer_condition())).scalars():
+            delta.add_balances(balance or 0)
+
+        for transaction_type, transactions, amount in db.execute(
+            select(
+                Transaction.type,
+                func.count(func.distinct(Transaction.id)),
+                func.coalesce(func.sum(TransactionRecipient.bucks), 0),
+            )
+            .join(TransactionRecipient, TransactionRecipient.transaction_id == Transaction.id)
+            .where(TransactionRecipient.counted)
+            .group_by(Transaction.type)
+        ):
+            delta.add(SCOPE_TYPE, transaction_type.value, count=transactions, amount=amount)
+        return delta
+
+    @classmethod
+    def version_query(cls):
+        """Version stamp of the aggregates, a sum over a few hundred rows"""
+        return select(func.coalesce(func.sum(cls.version), 0))
+
+    @classmethod
+    def all_query(cls):
+        """All aggregates with their shards summed, and the version stamp they were read at"""
+        return select(
+            cls.scope,
+            cls.key,
+            func.sum(cls.count),
+            func.sum(cls.amount),
+            func.sum(func.sum(cls.version)).over(),
+        ).group_by(cls.scope, cls.key)
@@ -1,12 +1,50 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Enum as SQLEnum, Float
-from sqlalchemy.orm import relationship, Session
-from sqlalchemy.sql import func
 from loguru import logger
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    false,
+    insert,
+    literal,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy import Enum as SQLEnum
+from sqlalchemy.orm import Session, relationship
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql import func
 
-from app.db.session import Base, SessionLocal
 from app.core.constants import States, TransactionTypeEnum
-
-# Import enum classes for validation
+from app.core.money import MoneyType
+from app.db.session import Base, SessionLocal
+from app.models.statistics_aggregate import (
+    ATTENDANCE_COUNTERS,
+    SCOPE_TYPE,
+    StatisticsAggregate,
+    StatisticsDelta,
+    pioneer_condition,
+)
+
+# Attendance transaction types and the recipient counter each one increments
+ATTENDANCE_COUNTER_FIELDS = {
+    TransactionTypeEnum.fac_attend: 'fac',
+    TransactionTypeEnum.lec_attend: 'lec',
+    TransactionTypeEnum.sem_attend: 'sem',
+    TransactionTypeEnum.lab_pass: 'lab',
+}
+
+# State machine of a transaction
+ALLOWED_TRANSITIONS = {
+    States.created: [States.processed, States.declined],
+    States.processed: [States.substituted],
+    States.declined: [],
+    States.substituted: []
+}
 
 
 class TransactionRecipient(Base):
@@ -16,8 +54,8 @@ class TransactionRecipient(Base):
     id = Column(Integer, primary_key=True, index=True)
     transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    bucks = Column(Float, default=0)  # Деньги
-    certs = Column(Float, default=0)  # Сертификаты
+    bucks = Column(MoneyType, default=0)  # Деньги
+    certs = Column(MoneyType, default=0)  # Сертификаты
     lab = Column(Integer, default=0)
     lec = Column(Integer, default=0)
     sem = Column(Integer, default=0)
@@ -31,32 +69,50 @@ class TransactionRecipient(Base):
     user = relationship("User")
     transaction = relationship("Transaction", back_populates="recipients")
 
-    def apply(self):
-        if self.counted:
-            raise AttributeError("Already counted")
-        self.counted = True
-        self.update_timestamp = func.now()
-        # Применить изменения к пользователю
-        self.user.balance += self.bucks
-        self.user.certificates += self.certs
-        # Обновить счетчики посещаемости
-        self.user.lab_count += self.lab
-        self.user.lec_count += self.lec
-        self.user.sem_count += self.sem
-        self.user.fac_count += self.fac
-
-    def undo(self):
-        if not self.counted:
-            raise AttributeError("Not counted yet")
-        self.counted = False
-        self.update_timestamp = func.now()
-        self.user.balance -= self.bucks
-        self.user.certificates -= self.certs
-        # Откатить счетчики посещаемости
-        self.user.lab_count -= self.lab
-        self.user.lec_count -= self.lec
-        self.user.sem_count -= self.sem
-        self.user.fac_count -= self.fac
+    __table_args__ = (
+        # Recipients of a transaction: apply/undo, serialization, totals
+        Index("ix_transaction_recipients_transaction_id", "transaction_id"),
+        # History and attendance counters of a user, counters are covered for index-only sums
+        Index(
+            "ix_transaction_recipients_user_id_counted",
+            "user_id",
+            "counted",
+            postgresql_include=["lab", "lec", "sem", "fac"],
+        ),
+    )
+
+    def full_info_as_list(self):
+        """Get full info as a list for export"""
+        return [
+            self.transaction_id,
+            self.user.username,
+            self.bucks,
+            self.certs,
+            self.lab,
+            self.lec,
+            self.sem,
+            self.fac,
+            self.counted,
+            self.description,
+            self.creation_timestamp.strftime('%d.%m.%Y %H:%M'),
+        ]
+
+    @staticmethod
+    def full_info_headers_as_list():
+        """Get header names for export"""
+        return [
+            'transaction_id',
+            'username',
+            'bucks',
+            'certs',
+            'lab',
+            'lec',
+            'sem',
+            'fac',
+            'counted',
+            'description',
+            'creation_timestamp',
+        ]
 
 
 class Transaction(Base):
@@ -78,9 +134,18 @@ class Transaction(Base):
     # New relationships for recipients
     recipients = relationship("TransactionRecipient", back_populates="transaction", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Transaction listings are ordered by (creation_timestamp, id)
+        Index("ix_transactions_creation_timestamp_id", "creation_timestamp", "id"),
+        Index("ix_transactions_creator_id_creation_timestamp", "creator_id", "creation_timestamp"),
+    )
+
     @classmethod
-    def new_transaction(cls, creator, transaction_type, description="", recipients=None, update_of=None, db=None):
-        """Create a new transaction"""
+    def new_transaction(cls, creator, transaction_type, description="", recipients=None, update_of=None, db=None, commit=True):
+        """
+        Create a new transaction with all of its recipients in a single DB transaction.
+        With commit=False it is only flushed, so the caller can add more to the same DB transaction
+        """
         if recipients is None:
             recipients = []
             
@@ -108,69 +173,19 @@ class Transaction(Base):
             )
 
             db.add(new_transaction)
-            db.commit()
-            db.refresh(new_transaction)
+            # Flush to obtain the id without committing, recipients go into the same transaction
+            db.flush()
             
             # Create recipients if provided
             if recipients:
-                from app.models.user import User
-                
-                for recipient_data in recipients:
-                    # Handle different recipient data formats
-                    if isinstance(recipient_data, dict):
-                        # Frontend sends 'id' and 'amount', backend expects 'username' and 'bucks'
-                        user_id = recipient_data.get('id')
-                        amount = recipient_data.get('amount', 0)
-                        
-                        # For attendance types, we need to set the appropriate counter
-                        bucks = 0
-                        certs = 0
-                        lab = 0
-                        lec = 0
-                        sem = 0
-                        fac = 0
-                        
-                        # Set bucks for financial transactions
-                        if transaction_type not in [TransactionTypeEnum.fac_attend, TransactionTypeEnum.lec_attend, 
-                                                   TransactionTypeEnum.sem_attend, TransactionTypeEnum.lab_pass]:
-                            bucks = amount
-                        
-                        # Set appropriate counter for attendance types
-                        if transaction_type == TransactionTypeEnum.fac_attend:
-                            fac = 1
-                        elif transaction_type == TransactionTypeEnum.lec_attend:
-                            lec = 1
-                        elif transaction_type == TransactionTypeEnum.sem_attend:
-                            sem = 1
-                        elif transaction_type == TransactionTypeEnum.lab_pass:
-                            lab = 1
-                        
-                        # Handle legacy format with username
-                        username = recipient_data.get('username')
-                        if username:
-                            user = db.query(User).filter(User.username == username).first()
-                        elif user_id:
-                            user = db.query(User).filter(User.id == user_id).first()
-                        else:
-                            raise ValueError(f"Invalid recipient data: {recipient_data}")
-                        
-                        if not user:
-                            raise ValueError(f"User not found: {username or user_id}")
-
-                        recipient = TransactionRecipient(
-                            transaction_id=new_transaction.id,
-                            user_id=user.id,
-                            bucks=bucks,
-                            certs=certs,
-                            lab=lab,
-                            lec=lec,
-                            sem=sem,
-                            fac=fac,
-                            description=description
-                        )
-                        db.add(recipient)
-                
+                rows = cls._build_recipient_rows(recipients, transaction_type, description, db)
+                for row in rows:
+                    row["transaction_id"] = new_transaction.id
+                db.execute(insert(TransactionRecipient), rows)
+
+            if commit:
                 db.commit()
+                db.refresh(new_transaction)
             
             return new_transaction
         except Exception as e:
@@ -181,8 +196,108 @@ class Transaction(Base):
             if close_session:
                 db.close()
 
-    def process(self, db: Session = None):
-        """Process the transaction - change state to processed and apply all atomics"""
+    @classmethod
+    def new_pioneer_transaction(cls, creator, transaction_type, bucks, description, db: Session):
+        """
+        Create a transaction with every active pioneer as a recipient of bucks.
+        Recipients are added with one INSERT ... SELECT from users. Nothing is committed,
+        the caller processes or rolls back. Returns the transaction and the number of recipients
+        """
+        from app.models.user import User
+
+        transaction = cls.new_transaction(
+            creator=creator,
+            transaction_type=transaction_type,
+            description=description,
+            db=db,
+            commit=False,
+        )
+        recipients_count = db.execute(
+            insert(TransactionRecipient).from_select(
+                ["transaction_id", "user_id", "bucks", "certs", "lab", "lec", "sem", "fac", "description", "counted"],
+                select(
+                    literal(transaction.id),
+                    User.id,
+                    literal(bucks, MoneyType()),
+                    literal(0, MoneyType()),
+                    literal(0),
+                    literal(0),
+                    literal(0),
+                    literal(0),
+                    literal(description),
+                    false(),
+                ).where(
+                    User.is_active == True,
+                    User.is_staff == False,
+                    User.is_superuser == False
+                ),
+            )
+        ).rowcount
+        return transaction, recipients_count
+
+    @staticmethod
+    def _build_recipient_rows(recipients, transaction_type, description, db: Session):
+        """Resolve all recipients with one query and build rows for a batched insert"""
+        from app.models.user import User
+
+        # Frontend sends 'id' and 'amount', legacy format uses 'username'
+        usernames = set()
+        user_ids = set()
+        for recipient_data in recipients:
+            if not isinstance(recipient_data, dict):
+                continue
+            username = recipient_data.get('username')
+            user_id = recipient_data.get('id')
+            if username:
+                usernames.add(username)
+            elif user_id:
+                user_ids.add(int(user_id))
+            else:
+                raise ValueError(f"Invalid recipient data: {recipient_data}")
+
+        ids_by_username = {}
+        known_ids = set()
+        if usernames or user_ids:
+            found = db.query(User.id, User.username).filter(
+                or_(User.username.in_(list(usernames)), User.id.in_(list(user_ids)))
+            ).all()
+            for user_id, username in found:
+                ids_by_username[username] = user_id
+                known_ids.add(user_id)
+
+        missing = sorted(usernames - ids_by_username.keys()) + sorted(str(i) for i in user_ids - known_ids)
+        if missing:
+            raise ValueError(f"Users not found: {', '.join(missing)}")
+
+        # Attendance types increment a counter instead of moving money
+        counter_field = ATTENDANCE_COUNTER_FIELDS.get(transaction_type)
+
+        rows = []
+        for recipient_data in recipients:
+            if not isinstance(recipient_data, dict):
+                continue
+            username = recipient_data.get('username')
+            row = {
+                "user_id": ids_by_username[username] if username else int(recipient_data['id']),
+                "bucks": 0 if counter_field else recipient_data.get('amount', 0),
+                "certs": 0,
+                "lab": 0,
+                "lec": 0,
+                "sem": 0,
+                "fac": 0,
+                "description": description,
+                "counted": False,
+            }
+            if counter_field:
+                row[counter_field] = 1
+            rows.append(row)
+        return rows
+
+    def process(self, db: Session = None, commit=True):
+        """
+        Process the transaction - change state to processed and apply all atomics.
+        With commit=False the caller commits or rolls back the DB transaction
+        """
         from app.db.session import SessionLocal
 
         close_session = False
@@ -191,94 +306,216 @@ class Transaction(Base):
             close_session = True
 
         try:
-            if self.can_be_transitioned_to(States.processed, db):
-                if not self._is_counted():
-                    # For p2p transactions, check sender balance and deduct money
-                    if self.type == TransactionTypeEnum.p2p:
-                        total_amount = self._get_total_amount(db)
-                        if self.creator.balance < total_amount:
-                            raise ValueError(f"Insufficient balance. Required: {total_amount}, Available: {self.creator.balance}")
-                        
-                        # Deduct money from sender
-                        self.creator.balance -= total_amount
-                        db.add(self.creator)
-                    
-                    # Apply all recipients
-                    for atomic in self.get_all_atomics(db):
-                        atomic.apply()
-
-                self.state = States.processed
-                db.add(self)
-                db.commit()
-            else:
-                raise AttributeError("Cannot process the transaction in its current state")
+            self._change_state(States.processed, "process", db, commit)
         finally:
             if close_session:
                 db.close()
 
-    def decline(self, db: Session):
+    def decline(self, db: Session, commit=True):
         """Decline the transaction"""
-        if self.can_be_transitioned_to(States.declined, db):
-            self._undo(db)
-            self.state = States.declined
-            db.add(self)
-            db.commit()
-        else:
-            raise AttributeError("Cannot decline the transaction in its current state")
+        self._change_state(States.declined, "decline", db, commit)
 
-    def substitute(self, db: Session):
+    def substitute(self, db: Session, commit=True):
         """Mark the transaction as substituted"""
-        if self.can_be_transitioned_to(States.substituted, db):
+        self._change_state(States.substituted, "substitute", db, commit)
+
+    def _change_state(self, new_state, action: str, db: Session, commit: bool):
+        """Transition to new_state, committing it or rolling back on failure when commit is set"""
+        try:
+            if not self._transition(new_state, db):
+                raise AttributeError(f"Cannot {action} the transaction in its current state")
+            if commit:
+                db.commit()
+        except Exception:
+            if commit:
+                db.rollback()
+            raise
+
+    def _transition(self, new_state, db: Session):
+        """
+        Move the transaction to new_state with an atomic compare-and-set
+        UPDATE ... WHERE state = :expected RETURNING id and apply or undo its effects.
+        Effects run only if this call actually changed the state, so concurrent
+        requests can't apply the same transaction twice. Returns False otherwise
+        """
+        expected_state = self.state
+        if not self.can_be_transitioned_to(new_state):
+            return False
+
+        changed = db.execute(
+            update(Transaction)
+            .where(Transaction.id == self.id, Transaction.state == expected_state)
+            .values(state=new_state)
+            .returning(Transaction.id)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if changed is None:
+            return False
+        # Keep the loaded state current without marking the object dirty
+        set_committed_value(self, "state", new_state)
+
+        if new_state == States.processed:
+            self._do(db)
+        elif expected_state == States.processed:
             self._undo(db)
-            self.state = States.substituted
-            db.add(self)
-            db.commit()
-        else:
-            raise AttributeError("Cannot substitute the transaction in its current state")
+        return True
+
+    def _do(self, db: Session):
+        """Apply the effects of the transaction"""
+        # Lock every affected user in id order so concurrent transactions can't deadlock
+        self._lock_users(db)
+        statistics = StatisticsDelta()
+
+        # For p2p transactions, check sender balance and deduct money atomically
+        if self.type == TransactionTypeEnum.p2p:
+            total_amount = self._get_total_amount(db)
+            if not self._debit_creator(db, total_amount, statistics):
+                raise ValueError(f"Insufficient balance. Required: {total_amount}")
+
+        # Apply all recipients
+        self._apply_atomics(db, 1, statistics)
 
     def _undo(self, db: Session):
         """Undo the effects of the transaction"""
-        if self._is_counted():
-            # For p2p transactions, return money to sender
-            if self.type == TransactionTypeEnum.p2p:
-                total_amount = self._get_total_amount(db)
-                self.creator.balance += total_amount
-                db.add(self.creator)
-            
-            # Undo all recipients
-            for atomic in self.get_all_atomics(db):
-                atomic.undo()
+        self._lock_users(db)
+        statistics = StatisticsDelta()
+
+        # For p2p transactions, return money to sender
+        if self.type == TransactionTypeEnum.p2p:
+            total_amount = self._get_total_amount(db)
+            self._debit_creator(db, -total_amount, statistics)
+
+        # Undo all recipients
+        self._apply_atomics(db, -1, statistics)
+
+    def _lock_users(self, db: Session):
+        """Lock the creator and all recipients with SELECT ... FOR UPDATE in a fixed (user id) order"""
+        from app.models.user import User
+
+        recipient_ids = select(TransactionRecipient.user_id).where(TransactionRecipient.transaction_id == self.id)
+        db.query(User.id).filter(
+            or_(User.id.in_(recipient_ids), User.id == self.creator_id)
+        ).order_by(User.id).with_for_update().all()
+
+    def _debit_creator(self, db: Session, amount, statistics: StatisticsDelta):
+        """
+        Take money from the creator with a guarded UPDATE ... WHERE balance >= amount.
+        A negative amount refunds the creator unconditionally. Returns False if the balance is insufficient.
+        The change of the statistics is added to the statistics delta
+        """
+        from app.models.user import User
+
+        statement = update(User).where(User.id == self.creator_id)
+        if amount > 0:
+            statement = statement.where(User.balance >= amount)
+        creator = db.execute(
+            statement
+            .values(balance=User.balance - amount)
+            .returning(User.party, pioneer_condition(), User.balance)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if creator is None:
+            return False
+
+        party, is_pioneer, balance = creator
+        if is_pioneer:
+            statistics.add_pioneers(str(party), balance=-amount)
+            statistics.move_balance(balance + amount, balance)
+        return True
+
+    def _apply_atomics(self, db: Session, sign: int, statistics: StatisticsDelta):
+        """
+        Apply (sign=1) or undo (sign=-1) all recipients with a constant number of statements:
+        one aggregated UPDATE of users, one UPDATE flipping the counted flags and one upsert
+        of the statistics together with the changes already in the statistics delta
+        """
+        from app.models.user import User
+
+        totals = (
+            select(
+                TransactionRecipient.user_id.label("user_id"),
+                func.sum(TransactionRecipient.bucks).label("bucks"),
+                func.sum(TransactionRecipient.certs).label("certs"),
+                func.sum(TransactionRecipient.lab).label("lab"),
+                func.sum(TransactionRecipient.lec).label("lec"),
+                func.sum(TransactionRecipient.sem).label("sem"),
+                func.sum(TransactionRecipient.fac).label("fac"),
+            )
+            .where(
+                TransactionRecipient.transaction_id == self.id,
+                TransactionRecipient.counted == (sign < 0),
+            )
+            .group_by(TransactionRecipient.user_id)
+            .subquery()
+        )
+
+        self._record_statistics(db, sign, totals, statistics)
+        StatisticsAggregate.add(db, statistics, self.id)
+
+        # UPDATE users ... FROM (aggregate) WHERE users.id = aggregate.user_id
+        db.execute(
+            update(User)
+            .where(User.id == totals.c.user_id)
+            .values(
+                balance=User.balance + sign * totals.c.bucks,
+                certificates=User.certificates + sign * totals.c.certs,
+                lab_count=User.lab_count + sign * totals.c.lab,
+                lec_count=User.lec_count + sign * totals.c.lec,
+                sem_count=User.sem_count + sign * totals.c.sem,
+                fac_count=User.fac_count + sign * totals.c.fac,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        db.execute(
+            update(TransactionRecipient)
+            .where(
+                TransactionRecipient.transaction_id == self.id,
+                TransactionRecipient.counted == (sign < 0),
+            )
+            .values(counted=sign > 0, update_timestamp=func.now())
+            .execution_options(synchronize_session=False)
+        )
+
+    def _record_statistics(self, db: Session, sign: int, totals, statistics: StatisticsDelta):
+        """
+        Add the effect of applying (sign=1) or undoing (sign=-1) the recipients to the statistics
+        delta: one query joining the per-user totals with the balances they are about to change
+        """
+        from app.models.user import User
+
+        recipients = db.execute(
+            select(
+                User.party,
+                pioneer_condition(),
+                User.balance,
+                totals.c.bucks,
+                *(totals.c[name] for name in ATTENDANCE_COUNTERS),
+            )
+            .select_from(totals)
+            .join(User, User.id == totals.c.user_id)
+        ).all()
+
+        flow = 0
+        for party, pioneer, balance, bucks, *attendance in recipients:
+            flow += bucks
+            if pioneer:
+                counters = [sign * int(value) for value in attendance]
+                statistics.add_pioneers(str(party), balance=sign * bucks, counters=counters)
+                statistics.move_balance(balance, balance + sign * bucks)
+        statistics.add(SCOPE_TYPE, self.type.value, count=sign, amount=sign * flow)
 
-    def _is_counted(self):
-        """Check if transaction is counted based on state"""
-        return self.state in [States.processed]
-    
     def _get_total_amount(self, db: Session):
         """Calculate total amount of money in this transaction"""
-        recipients = self.get_all_atomics(db)
-        return sum(recipient.bucks for recipient in recipients)
+        return self.money_count(db)
 
-    def get_all_atomics(self, db: Session):
+    def get_all_atomics(self):
         """Get all atomic transactions (recipients) related to this transaction"""
-        return db.query(TransactionRecipient).filter(TransactionRecipient.transaction_id == self.id).all()
-
-    def can_be_transitioned_to(self, new_state, db: Session):
-        """Check if the transaction can be transitioned to the given state"""
-        # Check that all recipients are in the correct counted state
-        recipients = db.query(TransactionRecipient).filter(TransactionRecipient.transaction_id == self.id).all()
-        for atomic in recipients:
-            if atomic.counted != self._is_counted():
-                return False
-
-        # Check if the transition is allowed
-        allowed_transitions = {
-            States.created: [States.processed, States.declined],
-            States.processed: [States.substituted],
-            States.declined: [],
-            States.substituted: []
-        }
-        
-        return new_state in allowed_transitions.get(self.state, [])
+        return self.recipients
+
+    def can_be_transitioned_to(self, new_state):
+        """Check if the transition from the current state to the given state is allowed"""
+        return new_state in ALLOWED_TRANSITIONS.get(self.state, [])
 
     def receivers_count(self, db: Session):
         """Get count of unique receivers"""
@@ -286,12 +523,14 @@ class Transaction(Base):
 
     def money_count(self, db: Session):
         """Get total money value"""
-        recipients = db.query(TransactionRecipient).filter(TransactionRecipient.transaction_id == self.id).all()
-        return sum(recipient.bucks for recipient in recipients)
+        return db.query(func.coalesce(func.sum(TransactionRecipient.bucks), 0)).filter(
+            TransactionRecipient.transaction_id == self.id
+        ).scalar()
 
     def money_count_string(self, db: Session):
         """Get formatted money count string"""
-        total = self.money_count(db)
+        # Formatted as a float like before money became exact: +10.0, not +10.00
+        total = float(self.money_count(db))
         if total > 0:
             return f"+{total}"
         return str(total)
@@ -326,7 +565,8 @@ class Transaction(Base):
             self.update_of_id or 'NA'
         ]
 
-    def full_info_headers_as_list(self):
+    @staticmethod
+    def full_info_headers_as_list():
         """Get header names for export"""
         return [
             'transaction_id',
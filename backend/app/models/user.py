@@ -1,9 +1,34 @@
-from sqlalchemy import Boolean, Column, String, Integer, Float, DateTime, ForeignKey
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    select,
+    text,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
-from app.db.session import Base
 import app.core.constants as c
+from app.core.fines import obligatory_study_fine
+from app.core.money import MoneyType
+from app.db.session import Base
+
+# Attendance totals summed from counted TransactionRecipient rows
+COUNTER_FIELDS = ('lab', 'lec', 'sem', 'fac')
+
+# Map counter names to TransactionRecipient fields
+COUNTER_FIELD_MAP = {
+    'seminar_attend': 'sem',
+    'seminar_pass': 'sem',
+    'fac_attend': 'fac',
+    'fac_pass': 'fac',
+    'lab_pass': 'lab',
+    'lecture_miss': 'lec'
+}
 
 
 class User(Base):
@@ -19,8 +44,8 @@ class User(Base):
     middle_name = Column(String, nullable=True)
     
     # School-specific info
-    balance = Column(Float, default=0)
-    certificates = Column(Float, default=0)  # Сертификаты
+    balance = Column(MoneyType, default=0)
+    certificates = Column(MoneyType, default=0)  # Сертификаты
     party = Column(Integer, default=0)
     grade = Column(Integer, default=0)
     
@@ -46,41 +71,40 @@ class User(Base):
     bio = Column(String(1024), default="", nullable=True)  # Биография
     position = Column(String(256), default="", nullable=True)  # Должность
     badge_id = Column(Integer, ForeignKey("badges.id"), nullable=True)  # Плашка пользователя
+    avatar_hash = Column(String(32), nullable=True)  # Хэш содержимого текущей аватарки
     
     # Badge relationship
     badge = relationship("Badge", lazy="select")
+
+    __table_args__ = (
+        # Active pioneers: taxes, fines and statistics
+        Index(
+            "ix_users_active_pioneers",
+            "id",
+            postgresql_where=text("is_active AND NOT is_staff AND NOT is_superuser"),
+            postgresql_include=["balance", "party", "grade"],
+        ),
+    )
     
     # Count attendance by type
-    def get_counter(self, counter_name, db):
-        """Get the count of a specific attendance type"""
+    def get_counters(self, db):
+        """Get all attendance totals (lab, lec, sem, fac) in one query"""
         from app.models.transaction import TransactionRecipient
         
-        # Map counter names to TransactionRecipient fields
-        counter_field_map = {
-            'seminar_attend': 'sem',
-            'seminar_pass': 'sem', 
-            'fac_attend': 'fac',
-            'fac_pass': 'fac',
-            'lab_pass': 'lab',
-            'lecture_miss': 'lec'
-        }
-        
-        field_name = counter_field_map.get(counter_name)
+        totals = db.execute(
+            select(*(func.coalesce(func.sum(getattr(TransactionRecipient, field)), 0) for field in COUNTER_FIELDS))
+            .where(TransactionRecipient.user_id == self.id, TransactionRecipient.counted)
+        ).one()
+        return dict(zip(COUNTER_FIELDS, totals))
+
+    def get_counter(self, counter_name, db=None, counters=None):
+        """Get the count of a specific attendance type"""
+        field_name = COUNTER_FIELD_MAP.get(counter_name)
         if not field_name:
             return 0
-            
-        # Get all counted transaction recipients for this user
-        recipients = db.query(TransactionRecipient).filter(
-            TransactionRecipient.user_id == self.id,
-            TransactionRecipient.counted,
-        ).all()
-        
-        # Sum up the specific counter field
-        total = 0
-        for recipient in recipients:
-            total += getattr(recipient, field_name, 0)
-            
-        return total
+        if counters is None:
+            counters = self.get_counters(db)
+        return counters[field_name]
     
     # Name formatting
     def __str__(self):
@@ -126,67 +150,60 @@ class User(Base):
         
         return recipients
     
-    # Study performance and fines calculation
-    def get_final_study_fine(self, db):
+    # Study performance and fines calculation.
+    # counters are the totals of get_counters(), they are queried once if not given
+    def get_final_study_fine(self, db, counters=None):
         """Calculate total study fine"""
+        if counters is None:
+            counters = self.get_counters(db)
         return sum([
-            self.get_sem_fine(db),
-            self.get_obl_study_fine(db),
-            self.get_lab_fine(db),
-            self.get_fac_fine(db),
+            self.get_sem_fine(db, counters),
+            self.get_obl_study_fine(db, counters),
+            self.get_lab_fine(db, counters),
+            self.get_fac_fine(db, counters),
         ])
         
-    def get_equator_study_fine(self, db):
+    def get_equator_study_fine(self, db, counters=None):
         """Calculate equator study fine"""
-        return self.get_obl_study_fine_equator(db) + self.get_lab_fine_equator(db)
+        if counters is None:
+            counters = self.get_counters(db)
+        return self.get_obl_study_fine_equator(db, counters) + self.get_lab_fine_equator(db, counters)
         
-    def get_sem_fine(self, db):
+    def get_sem_fine(self, db, counters=None):
         """Calculate seminar fine"""
-        return c.SEM_NOT_READ_PEN * max(0, 1 - self.get_counter('seminar_pass', db))
+        return c.SEM_NOT_READ_PEN * max(0, 1 - self.get_counter('seminar_pass', db, counters))
         
-    def get_lab_fine(self, db):
+    def get_lab_fine(self, db, counters=None):
         """Calculate laboratory fine"""
-        return max(0, self.lab_needed() - self.get_counter('lab_pass', db)) * c.LAB_PENALTY
+        return max(0, self.lab_needed() - self.get_counter('lab_pass', db, counters)) * c.LAB_PENALTY
         
-    def get_lab_fine_equator(self, db):
+    def get_lab_fine_equator(self, db, counters=None):
         """Calculate laboratory fine at equator"""
-        return max(0, (c.LAB_PASS_NEEDED_EQUATOR - self.get_counter('lab_pass', db))) * c.LAB_PENALTY
+        return max(0, (c.LAB_PASS_NEEDED_EQUATOR - self.get_counter('lab_pass', db, counters))) * c.LAB_PENALTY
         
-    def get_obl_study_fine(self, db):
+    def get_obl_study_fine(self, db, counters=None):
         """Calculate obligatory study fine"""
-
-        seminar_count = self.get_counter('seminar_attend', db)
-        fac_count = self.get_counter('fac_attend', db)
+        if counters is None:
+            counters = self.get_counters(db)
+        seminar_count = self.get_counter('seminar_attend', db, counters)
+        fac_count = self.get_counter('fac_attend', db, counters)
         
         deficit = max(0, c.OBL_STUDY_NEEDED - int(seminar_count + fac_count))
-        single_fine = c.INITIAL_STEP_OBL_STD
-        fine = 0
+        return obligatory_study_fine(deficit)
         
-        for _ in range(deficit):
-            fine += single_fine
-            single_fine += c.STEP_OBL_STD
-            
-        return fine
-        
-    def get_obl_study_fine_equator(self, db):
+    def get_obl_study_fine_equator(self, db, counters=None):
         """Calculate obligatory study fine at equator"""
-
-        seminar_count = self.get_counter('seminar_attend', db)
-        fac_count = self.get_counter('fac_attend', db)
+        if counters is None:
+            counters = self.get_counters(db)
+        seminar_count = self.get_counter('seminar_attend', db, counters)
+        fac_count = self.get_counter('fac_attend', db, counters)
         
         deficit = max(0, c.OBL_STUDY_NEEDED_EQUATOR - int(seminar_count + fac_count))
-        single_fine = c.INITIAL_STEP_OBL_STD
-        fine = 0
-        
-        for _ in range(deficit):
-            fine += single_fine
-            single_fine += c.STEP_OBL_STD
-            
-        return fine
+        return obligatory_study_fine(deficit)
         
-    def get_fac_fine(self, db):
+    def get_fac_fine(self, db, counters=None):
         """Calculate faculty fine"""
-        return max(0, (self.fac_needed() - self.get_counter('fac_pass', db))) * c.FAC_PENALTY
+        return max(0, (self.fac_needed() - self.get_counter('fac_pass', db, counters))) * c.FAC_PENALTY
         
     def lab_needed(self):
         """Get required number of labs based on grade"""
@@ -196,9 +213,9 @@ class User(Base):
         """Get required number of faculty passes based on grade"""
         return c.FAC_PASS_NEEDED.get(self.grade, 1)  # Default to 1 if grade not found
         
-    def get_next_missed_lec_penalty(self, db):
+    def get_next_missed_lec_penalty(self, db, counters=None):
         """Calculate penalty for next missed lecture"""
-        return (self.get_counter('lecture_miss', db) *
+        return (self.get_counter('lecture_miss', db, counters) *
                 c.LECTURE_PENALTY_STEP + c.LECTURE_PENALTY_INITIAL)
     
     # Data export methods
@@ -234,7 +251,8 @@ class User(Base):
             
         return result
         
-    def full_info_headers_as_list(self):
+    @staticmethod
+    def full_info_headers_as_list():
         """Get header names for user info list"""
         return [
             'first_name', 
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, ConfigDict
 from typing import Optional
 
+from pydantic import BaseModel, ConfigDict
+
 
 class BadgeBase(BaseModel):
     """Базовая схема плашки"""
@@ -26,5 +27,6 @@ class Badge(BadgeBase):
     """Схема плашки для отправки клиенту"""
     id: int
     is_active: bool = True
+    image_urls: Optional[dict[str, str]] = None  # Версионированные URL размеров изображения
     
     model_config = ConfigDict(from_attributes=True) 
\ No newline at end of file
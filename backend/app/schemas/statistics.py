@@ -0,0 +1,38 @@
+
+from pydantic import BaseModel
+
+from app.core.money import Money
+
+
+class PartyStatistics(BaseModel):
+    """Balance statistics of the pioneers of a party"""
+    student_count: int
+    total_balance: Money
+    avg_balance: Money
+
+
+class TypeFlow(BaseModel):
+    """Processed transactions of a type and the money they moved"""
+    transactions: int
+    amount: Money
+
+
+class HistogramBucket(BaseModel):
+    """Number of pioneers with a balance in [min, max)"""
+    min: Money
+    max: Money
+    count: int
+
+
+class StatisticsSnapshot(BaseModel):
+    """Statistics snapshot, version changes with every change of the underlying data"""
+    version: int
+    student_count: int
+    total_balance: Money
+    avg_balance: Money
+    median_balance: Money
+    percentiles: dict[str, Money]
+    histogram: list[HistogramBucket]
+    parties: dict[str, PartyStatistics]
+    flows: dict[str, TypeFlow]
+    counters: dict[str, int]
@@ -1,6 +1,10 @@
-from pydantic import BaseModel, ConfigDict
-from typing import Optional, List
 from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict
+
+from app.core.money import Money
+
 from .badge import Badge
 
 
@@ -86,7 +90,7 @@ class UserInDBBase(UserBase):
     grade: int = 0
     is_staff: bool = False
     is_superuser: bool = False
-    balance: float = 0
+    balance: Money = 0
     created_at: datetime
     updated_at: Optional[datetime] = None
     
@@ -98,7 +102,8 @@ class User(UserInDBBase):
     name: Optional[str] = None
     staff: bool = False
     expected_penalty: float = 0
-    counters: List[CounterSchema] = []
+    counters: list[CounterSchema] = []
+    avatar: Optional[dict[str, str]] = None  # Versioned avatar URLs by size
     badge: Optional[Badge] = None
 
     class Config:
@@ -112,7 +117,8 @@ class UserListItem(BaseModel):
     name: str
     party: int
     staff: bool
-    balance: float
+    balance: Money
+    avatar: Optional[dict[str, str]] = None
     badge: Optional[Badge] = None
 
     model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Script to check that the hot queries of the LFMSH Bank API are served by indexes.
+
+Creates the schema in a scratch PostgreSQL schema, fills it with a large synthetic
+dataset, runs EXPLAIN on every hot query and fails if any of them falls back to a
+sequential scan. Everything happens in one database transaction that is rolled back,
+so the script can be run against any database the backend can connect to.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent / "app"))
+
+from sqlalchemy import func, select, text, tuple_, union
+from sqlalchemy.dialects import postgresql
+
+from app.db.session import Base, engine
+from app.models.transaction import Transaction, TransactionRecipient
+from app.models.user import User
+
+SCHEMA = "query_plan_check"
+
+# Synthetic dataset: several seasons of deactivated accounts and their history
+USERS = 50_000
+ACTIVE_PIONEERS = 400
+TRANSACTIONS = 200_000
+RECIPIENTS_PER_TRANSACTION = 10
+
+# Tables that must never be scanned sequentially by a hot query
+HOT_TABLES = {"users", "transactions", "transaction_recipients"}
+
+
+def hot_queries():
+    """Hot queries of the API with representative parameters"""
+    user_id = ACTIVE_PIONEERS // 2
+    transaction_id = TRANSACTIONS // 2
+    pioneer = (User.is_active == True, User.is_staff == False, User.is_superuser == False)
+
+    return {
+        "user counters": select(
+            func.sum(TransactionRecipient.lab),
+            func.sum(TransactionRecipient.lec),
+            func.sum(TransactionRecipient.sem),
+            func.sum(TransactionRecipient.fac),
+        ).where(TransactionRecipient.user_id == user_id, TransactionRecipient.counted),
+        "transaction recipients": select(TransactionRecipient).where(
+            TransactionRecipient.transaction_id == transaction_id
+        ),
+        "created transactions": select(Transaction)
+        .where(Transaction.creator_id == user_id)
+        .order_by(Transaction.creation_timestamp.desc())
+        .limit(100),
+        "transactions page": select(Transaction)
+        .where(tuple_(Transaction.creation_timestamp, Transaction.id) < tuple_(func.now(), transaction_id))
+        .order_by(Transaction.creation_timestamp.desc(), Transaction.id.desc())
+        .limit(100),
+        "pioneer transactions page": select(Transaction)
+        .where(
+            Transaction.id.in_(
+                union(
+                    select(Transaction.id).where(Transaction.creator_id == user_id),
+                    select(TransactionRecipient.transaction_id).where(TransactionRecipient.user_id == user_id),
+                )
+            )
+        )
+        .order_by(Transaction.creation_timestamp.desc(), Transaction.id.desc())
+        .limit(100),
+        "active pioneers": select(User.id, User.grade).where(*pioneer),
+        "pioneer balances": select(func.count(User.id), func.sum(User.balance)).where(*pioneer),
+    }
+
+
+def fill_synthetic_data(connection):
+    """Fill the scratch schema with generate_series() data"""
+    connection.execute(text(f"""
+        INSERT INTO users (username, hashed_password, first_name, last_name, balance, certificates,
+                           party, grade, lab_count, lec_count, sem_count, fac_count,
+                           is_active, is_staff, is_superuser)
+        SELECT 'user' || i, '', 'Имя', 'Фамилия', 100, 0, i % 4, 8 + i % 3, 0, 0, 0, 0,
+               i <= {ACTIVE_PIONEERS + 50}, i > {ACTIVE_PIONEERS} AND i <= {ACTIVE_PIONEERS + 50}, false
+        FROM generate_series(1, {USERS}) AS i
+    """))
+    connection.execute(text(f"""
+        INSERT INTO transactions (creator_id, description, creation_timestamp, type, state)
+        SELECT 1 + i % {USERS}, '', now() - i * interval '1 minute', 'general', 'processed'
+        FROM generate_series(1, {TRANSACTIONS}) AS i
+    """))
+    connection.execute(text(f"""
+        INSERT INTO transaction_recipients (transaction_id, user_id, bucks, certs, lab, lec, sem, fac, counted)
+        SELECT t, 1 + (t * {RECIPIENTS_PER_TRANSACTION} + r) % {USERS}, 10, 0, 0, 1, 0, 0, true
+        FROM generate_series(1, {TRANSACTIONS}) AS t, generate_series(1, {RECIPIENTS_PER_TRANSACTION}) AS r
+    """))
+    for table in HOT_TABLES:
+        connection.execute(text(f"ANALYZE {table}"))
+
+
+def find_seq_scans(plan):
+    """Get relation names of all sequential scans in an EXPLAIN (FORMAT JSON) plan"""
+    scans = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in HOT_TABLES:
+        scans.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        scans.extend(find_seq_scans(child))
+    return scans
+
+
+def check_query_plans():
+    """Explain every hot query, returns a list of failures"""
+    failures = []
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+            connection.execute(text(f"SET LOCAL search_path TO {SCHEMA}"))
+            Base.metadata.create_all(bind=connection)
+            fill_synthetic_data(connection)
+
+            for name, query in hot_queries().items():
+                sql = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+                plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scans = find_seq_scans(plan[0]["Plan"])
+                if scans:
+                    failures.append(f"{name}: sequential scan on {', '.join(scans)}")
+                    print(f"FAIL {name}")
+                else:
+                    print(f"ok   {name}")
+        finally:
+            transaction.rollback()
+    return failures
+
+
+if __name__ == "__main__":
+    print("Checking query plans of the hot queries...")
+
+    failures = check_query_plans()
+    if failures:
+        print("Hot queries without index support:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+    print("All hot queries are served by indexes")
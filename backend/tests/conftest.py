@@ -0,0 +1,68 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # registers all tables
+from app.core.constants import TransactionTypeEnum
+from app.db.session import Base
+from app.models.transaction import Transaction
+from app.models.user import User
+
+
+@pytest.fixture
+def db():
+    """Session on a fresh in-memory SQLite database with all tables"""
+    engine = create_engine("sqlite://")
+
+    # Let SQLAlchemy emit BEGIN itself, so SAVEPOINTs work with pysqlite
+    @event.listens_for(engine, "connect")
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def make_user(db):
+    """Create and commit a user"""
+    def make(username, **fields):
+        fields.setdefault("first_name", "Иван")
+        fields.setdefault("last_name", "Иванов")
+        user = User(username=username, **fields)
+        db.add(user)
+        db.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def pay(db):
+    """Create a transaction from creator to (username, amount) recipients"""
+    def make(creator, recipients, transaction_type=TransactionTypeEnum.general):
+        return Transaction.new_transaction(
+            creator=creator,
+            transaction_type=transaction_type,
+            recipients=[{"username": username, "amount": amount} for username, amount in recipients],
+            db=db,
+        )
+    return make
+
+
+@pytest.fixture
+def balance(db):
+    """Balance of a user as stored in the DB"""
+    def get(user) -> Decimal:
+        return db.execute(select(User.balance).where(User.id == user.id)).scalar()
+    return get
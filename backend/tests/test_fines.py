@@ -0,0 +1,15 @@
+from app.core.fines import PioneerCounters, equator_study_fines, final_study_fines
+
+
+def test_vectorized_fines_match_per_user_fines_with_null_grade(db, make_user):
+    pioneers = [make_user("graded", grade=9), make_user("ungraded", grade=None)]
+    make_user("staff", is_staff=True, grade=None)
+
+    counters = PioneerCounters.load(db)
+    assert list(counters.user_ids) == [user.id for user in pioneers]
+
+    final = final_study_fines(counters)
+    equator = equator_study_fines(counters)
+    for index, user in enumerate(pioneers):
+        assert final[index] == user.get_final_study_fine(db)
+        assert equator[index] == user.get_equator_study_fine(db)
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.idempotency import response_cache, run_idempotent
+from app.models.idempotency_key import IdempotencyKey
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    response_cache.clear()
+    yield
+    response_cache.clear()
+
+
+class Handler:
+    """Counts its calls and returns the call number"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {"call": self.calls}
+
+
+def test_repeated_key_returns_stored_response(db, make_user):
+    user = make_user("pioneer")
+    handler = Handler()
+
+    assert run_idempotent(db, user.id, "key", "transactions/create", {"a": 1}, handler) == {"call": 1}
+    response_cache.clear()
+    assert run_idempotent(db, user.id, "key", "transactions/create", {"a": 1}, handler) == {"call": 1}
+    assert handler.calls == 1
+
+
+def test_expired_key_runs_request_again(db, make_user):
+    user = make_user("pioneer")
+    handler = Handler()
+    run_idempotent(db, user.id, "key", "transactions/create", {}, handler)
+    response_cache.clear()
+
+    expired = datetime.now(timezone.utc) - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS + 1)
+    db.query(IdempotencyKey).update({IdempotencyKey.created_at: expired})
+    db.commit()
+
+    assert run_idempotent(db, user.id, "key", "transactions/create", {}, handler) == {"call": 2}
+    assert db.query(IdempotencyKey).one().response == {"call": 2}
+
+
+def test_key_reused_for_another_request_is_rejected(db, make_user):
+    user = make_user("pioneer")
+    handler = Handler()
+    run_idempotent(db, user.id, "key", "transactions/create", {"a": 1}, handler)
+
+    for endpoint, data in (("transactions/seminar", {"a": 1}), ("transactions/create", {"a": 2})):
+        with pytest.raises(HTTPException) as error:
+            run_idempotent(db, user.id, "key", endpoint, data, handler)
+        assert error.value.status_code == 422
+    assert handler.calls == 1
+
+
+def test_failed_request_leaves_no_key(db, make_user):
+    user = make_user("pioneer")
+
+    def failing():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        run_idempotent(db, user.id, "key", "transactions/create", {}, failing)
+    assert db.query(IdempotencyKey).count() == 0
+
+    assert run_idempotent(db, user.id, "key", "transactions/create", {}, Handler()) == {"call": 1}
@@ -0,0 +1,9 @@
+from decimal import Decimal
+
+from app.core.money import to_money
+
+
+def test_money_is_rounded_to_cents_exactly():
+    assert to_money(0.1) + to_money(0.2) == Decimal("0.30")
+    assert to_money(2.675) == Decimal("2.68")
+    assert to_money(None) is None
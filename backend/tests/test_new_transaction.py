@@ -0,0 +1,31 @@
+import pytest
+
+from app.core.constants import TransactionTypeEnum
+from app.models.transaction import Transaction, TransactionRecipient
+
+
+def test_recipients_are_created_together(db, make_user):
+    staff = make_user("staff", is_staff=True)
+    first = make_user("first")
+    second = make_user("second")
+    transaction = Transaction.new_transaction(
+        creator=staff,
+        transaction_type=TransactionTypeEnum.general,
+        recipients=[{"username": "first", "amount": 1}, {"id": second.id, "amount": 2}],
+        db=db,
+    )
+
+    recipients = db.query(TransactionRecipient).filter(TransactionRecipient.transaction_id == transaction.id).all()
+    assert sorted((recipient.user_id, float(recipient.bucks)) for recipient in recipients) == [
+        (first.id, 1.0), (second.id, 2.0),
+    ]
+
+
+def test_all_missing_users_are_reported_and_nothing_is_created(db, make_user, pay):
+    staff = make_user("staff", is_staff=True)
+    make_user("pioneer")
+
+    with pytest.raises(ValueError, match="Users not found: ghost, phantom"):
+        pay(staff, [("pioneer", 1), ("phantom", 1), ("ghost", 1)])
+    assert db.query(Transaction).count() == 0
+    assert db.query(TransactionRecipient).count() == 0
@@ -0,0 +1,27 @@
+from decimal import Decimal
+
+import pytest
+
+from app.core.constants import States, TransactionTypeEnum
+from app.models.transaction import Transaction
+
+
+def test_p2p_with_insufficient_balance_changes_nothing(db, make_user, pay, balance):
+    sender = make_user("sender", balance=5)
+    receiver = make_user("receiver", balance=0)
+    transaction = pay(sender, [("receiver", 10)], TransactionTypeEnum.p2p)
+
+    with pytest.raises(ValueError):
+        transaction.process(db)
+    assert balance(sender) == Decimal("5.00")
+    assert balance(receiver) == Decimal("0.00")
+    assert db.get(Transaction, transaction.id).state == States.created
+
+
+def test_p2p_debits_the_sender(db, make_user, pay, balance):
+    sender = make_user("sender", balance=15)
+    receiver = make_user("receiver", balance=0)
+    pay(sender, [("receiver", 10)], TransactionTypeEnum.p2p).process(db)
+
+    assert balance(sender) == Decimal("5.00")
+    assert balance(receiver) == Decimal("10.00")
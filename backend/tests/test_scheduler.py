@@ -0,0 +1,27 @@
+from datetime import time
+
+from app.core.config import settings
+from app.core.constants import TransactionTypeEnum
+from app.core.scheduler import DAILY_TAX_JOB, load_jobs
+
+
+def test_invalid_jobs_are_skipped(monkeypatch):
+    monkeypatch.setattr(settings, "DAILY_TAX_TIME", "25:99")
+    monkeypatch.setattr(settings, "RECURRING_TRANSACTIONS", """[
+        {"name": "breakfast", "type": "general", "amount": 5, "time": "08:00"},
+        {"name": "no type", "amount": 5, "time": "08:00"},
+        {"name": "bad type", "type": "nope", "amount": 5, "time": "08:00"},
+        "not an object"
+    ]""")
+
+    jobs = load_jobs()
+    assert [job.name for job in jobs] == ["breakfast"]
+    assert jobs[0].transaction_type == TransactionTypeEnum.general
+    assert jobs[0].at == time(8, 0)
+
+
+def test_malformed_json_keeps_the_daily_tax(monkeypatch):
+    monkeypatch.setattr(settings, "DAILY_TAX_TIME", "03:00")
+    monkeypatch.setattr(settings, "RECURRING_TRANSACTIONS", "{not json")
+
+    assert [job.name for job in load_jobs()] == [DAILY_TAX_JOB]
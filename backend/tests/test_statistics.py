@@ -0,0 +1,130 @@
+from decimal import Decimal
+
+from sqlalchemy import func, select, update
+
+from app.core.constants import TransactionTypeEnum
+from app.core.statistics import StatisticsCache, build_snapshot
+from app.models.statistics_aggregate import (
+    SCOPE_BALANCE,
+    SCOPE_PARTY,
+    SCOPE_TOTAL,
+    SCOPE_TYPE,
+    StatisticsAggregate,
+    StatisticsDelta,
+)
+from app.models.user import User
+
+
+def total_statistics(db) -> Decimal:
+    return db.execute(
+        select(func.coalesce(func.sum(StatisticsAggregate.amount), 0)).where(StatisticsAggregate.scope == SCOPE_TOTAL)
+    ).scalar()
+
+
+def test_cache_serves_snapshot_only_for_its_version():
+    cache = StatisticsCache()
+    snapshot = cache.put({"version": 3})
+
+    assert cache.get(3) is snapshot
+    assert cache.get(4) is None
+    cache.put({"version": 4})
+    assert cache.get(3) is None
+
+
+def test_snapshot_from_aggregates():
+    aggregates = [
+        ("party", "1", 2, Decimal("30.00"), 7),
+        ("total", "", 3, Decimal("40.00"), 7),
+        ("type", "p2p", 5, Decimal("12.50"), 7),
+        ("counter", "lab", 4, Decimal("0.00"), 7),
+        # Balances 10, 10 and 20 in buckets of 10
+        ("balance", "2", 1, Decimal("0.00"), 7),
+        ("balance", "1", 2, Decimal("0.00"), 7),
+        ("balance", "0", 0, Decimal("0.00"), 7),
+    ]
+    snapshot = build_snapshot(aggregates)
+
+    assert snapshot["version"] == 7
+    assert snapshot["student_count"] == 3
+    assert snapshot["avg_balance"] == Decimal("13.33")
+    assert snapshot["parties"]["1"]["avg_balance"] == Decimal("15.00")
+    assert snapshot["flows"]["p2p"] == {"transactions": 5, "amount": Decimal("12.50")}
+    assert snapshot["counters"] == {"lab": 4}
+    assert snapshot["median_balance"] == Decimal("17.50")
+    assert snapshot["percentiles"]["90"] == Decimal("27.00")
+    assert snapshot["histogram"] == [
+        {"min": Decimal("10.00"), "max": Decimal("20.00"), "count": 2},
+        {"min": Decimal("20.00"), "max": Decimal("30.00"), "count": 1},
+    ]
+
+
+def test_delta_merges_changes_of_one_aggregate():
+    delta = StatisticsDelta()
+    delta.add_pioneers("1", balance=Decimal(-5))
+    delta.add_pioneers("1", balance=Decimal(8), counters=[1, 0, 0, 0])
+    delta.add(SCOPE_TYPE, "p2p", count=1, amount=Decimal(8))
+
+    rows = {(row["scope"], row["key"]): row for row in delta.rows(shard=2)}
+    assert rows[SCOPE_TOTAL, ""]["amount"] == Decimal(3)
+    assert rows[SCOPE_PARTY, "1"]["amount"] == Decimal(3)
+    assert {row["shard"] for row in rows.values()} == {2}
+    assert list(rows) == sorted(rows)
+
+
+def test_process_and_substitute_update_the_aggregates(db, make_user, pay, balance):
+    staff = make_user("staff", is_staff=True)
+    pioneer = make_user("pioneer", party=1, balance=0)
+    transaction = pay(staff, [("pioneer", 0.1), ("pioneer", 0.2)])
+
+    transaction.process(db)
+    assert balance(pioneer) == Decimal("0.30")
+    assert total_statistics(db) == Decimal("0.30")
+
+    transaction.substitute(db)
+    assert balance(pioneer) == Decimal("0.00")
+    assert total_statistics(db) == Decimal("0.00")
+
+
+def test_forced_populate_recounts_changes_made_behind_the_aggregates(db, make_user):
+    pioneer = make_user("pioneer", balance=0)
+    StatisticsAggregate.populate(db)
+    db.commit()
+    version = db.execute(StatisticsAggregate.version_query()).scalar()
+
+    # A manual fix that skips the aggregates
+    db.execute(update(User).where(User.id == pioneer.id).values(balance=7))
+    StatisticsAggregate.populate(db)
+    assert total_statistics(db) == Decimal("0.00")
+
+    StatisticsAggregate.populate(db, force=True)
+    db.commit()
+    assert total_statistics(db) == Decimal("7.00")
+    assert db.execute(StatisticsAggregate.version_query()).scalar() > version
+
+
+def balance_histogram(db) -> dict:
+    return {
+        int(key): count for key, count in db.execute(
+            select(StatisticsAggregate.key, func.sum(StatisticsAggregate.count))
+            .where(StatisticsAggregate.scope == SCOPE_BALANCE)
+            .group_by(StatisticsAggregate.key)
+        )
+        if count
+    }
+
+
+def test_balance_histogram_follows_balance_changes(db, make_user, pay):
+    staff = make_user("staff", is_staff=True)
+    sender = make_user("sender", balance=25)
+    make_user("receiver", balance=0)
+    StatisticsAggregate.populate(db)
+    db.commit()
+    assert balance_histogram(db) == {0: 1, 2: 1}
+
+    pay(sender, [("receiver", 12)], TransactionTypeEnum.p2p).process(db)
+    assert balance_histogram(db) == {1: 2}
+
+    pay(staff, [("receiver", 20)]).process(db)
+    assert balance_histogram(db) == {1: 1, 3: 1}
+    StatisticsAggregate.populate(db, force=True)
+    assert balance_histogram(db) == {1: 1, 3: 1}
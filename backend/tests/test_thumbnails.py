@@ -0,0 +1,39 @@
+import asyncio
+
+from app.core.thumbnails import ThumbnailCache
+
+
+def test_thumbnail_deleted_behind_the_cache_is_rendered_again(tmp_path):
+    cache = ThumbnailCache(tmp_path, max_bytes=1024)
+    renders = []
+
+    async def render() -> bytes:
+        renders.append(1)
+        return b"thumbnail"
+
+    async def scenario():
+        path = await cache.get("avatar_64.webp", render)
+        assert await cache.get("avatar_64.webp", render) == path
+        path.unlink()
+        return await cache.get("avatar_64.webp", render)
+
+    path = asyncio.run(scenario())
+    assert path.read_bytes() == b"thumbnail"
+    assert len(renders) == 2
+    assert cache.total_bytes == len(b"thumbnail")
+
+
+def test_least_recently_used_thumbnails_are_evicted(tmp_path):
+    cache = ThumbnailCache(tmp_path, max_bytes=10)
+
+    async def render() -> bytes:
+        return b"12345678"
+
+    async def scenario():
+        await cache.get("first.webp", render)
+        await cache.get("second.webp", render)
+
+    asyncio.run(scenario())
+    assert not (tmp_path / "first.webp").exists()
+    assert (tmp_path / "second.webp").exists()
+    assert cache.total_bytes == 8
@@ -0,0 +1,19 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.core.constants import States
+
+
+def test_stale_transaction_is_not_applied_twice(db, make_user, pay, balance):
+    staff = make_user("staff", is_staff=True)
+    pioneer = make_user("pioneer", balance=0)
+    transaction = pay(staff, [("pioneer", 10)])
+    transaction.process(db)
+
+    # A second request that still saw the transaction as created
+    set_committed_value(transaction, "state", States.created)
+    with pytest.raises(AttributeError):
+        transaction.process(db)
+    assert balance(pioneer) == Decimal("10.00")
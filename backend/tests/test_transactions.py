@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from app.api.v1.endpoints.transactions import (
+    format_transactions_for_frontend,
+    list_transactions,
+)
+from app.core.constants import TransactionTypeEnum
+from app.models.transaction import Transaction
+
+
+def test_list_returns_money_as_json_numbers(db, make_user):
+    staff = make_user("staff", is_staff=True)
+    make_user("pioneer")
+    transaction = Transaction.new_transaction(
+        creator=staff,
+        transaction_type=TransactionTypeEnum.general,
+        recipients=[{"username": "pioneer", "amount": 10}],
+        db=db,
+    )
+
+    receiver = format_transactions_for_frontend([transaction], db)[0]["receivers"][0]
+    assert receiver["bucks"] == 10
+    assert isinstance(receiver["bucks"], float)
+    assert isinstance(receiver["certs"], float)
+    assert transaction.money_count_string(db) == "+10.0"
+
+
+def test_empty_page_has_no_cursor(db, make_user):
+    staff = make_user("staff", is_staff=True)
+    make_user("pioneer")
+    Transaction.new_transaction(
+        creator=staff,
+        transaction_type=TransactionTypeEnum.general,
+        recipients=[{"username": "pioneer", "amount": 1}],
+        db=db,
+    )
+
+    for limit in (0, -1):
+        assert list_transactions(db, staff, limit=limit) == ([], None)
+
+
+def test_cursor_pages_cover_every_transaction_once(db, make_user, pay):
+    staff = make_user("staff", is_staff=True)
+    make_user("pioneer")
+    transactions = [pay(staff, [("pioneer", 1)]) for _ in range(5)]
+    # Two transactions share a timestamp, the id breaks the tie
+    start = datetime(2026, 7, 1, 12, 0)
+    for index, transaction in enumerate(transactions):
+        transaction.creation_timestamp = start + timedelta(minutes=min(index, 3))
+    db.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = list_transactions(db, staff, limit=2, cursor=cursor)
+        seen += [transaction["id"] for transaction in page]
+        if cursor is None:
+            break
+    assert seen == [transaction.id for transaction in reversed(transactions)]
@@ -0,0 +1,45 @@
+import asyncio
+import io
+
+from starlette.datastructures import Headers, UploadFile
+
+from app.api.v1.endpoints import users
+from app.models.user import User
+
+
+async def run_inline(function, *args):
+    return function(*args)
+
+
+def image(filename: str) -> UploadFile:
+    return UploadFile(io.BytesIO(b"image"), filename=filename, headers=Headers({"content-type": "image/png"}))
+
+
+def test_users_whose_avatar_failed_are_reported_as_imported(db, make_user, monkeypatch):
+    superuser = make_user("admin", is_superuser=True)
+
+    async def upload_avatar(file, username):
+        if username == "broken":
+            raise ValueError("cannot identify image file")
+        return "hash"
+
+    async def hash_password(password):
+        return "hashed"
+
+    monkeypatch.setattr(users, "run_in_threadpool", run_inline)
+    monkeypatch.setattr(users, "upload_avatar", upload_avatar)
+    monkeypatch.setattr(users, "get_password_hash_async", hash_password)
+    monkeypatch.setattr(users, "save_avatar_hashes", lambda avatar_hashes: None)
+
+    report = asyncio.run(users.import_users_from_images(
+        files=[image("fine,Иванов,Иван.png"), image("broken,Петров,Пётр.png"), image("admin,Сидоров,Сидор.png")],
+        progress=False,
+        db=db,
+        current_user=superuser,
+    ))
+
+    assert report["imported_users"] == ["fine", "broken"]
+    assert report["users_without_avatar"] == ["broken"]
+    assert report["avatar_errors"] == ["File broken,Петров,Пётр.png: cannot identify image file"]
+    assert report["errors"] == ["File admin,Сидоров,Сидор.png: Username 'admin' already exists"]
+    assert {user.username for user in db.query(User)} == {"admin", "fine", "broken"}